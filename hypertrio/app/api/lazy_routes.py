@@ -0,0 +1,61 @@
+from fastapi import FastAPI
+import asyncio
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRouters:
+    """Router modules by URL prefix, imported and included into ``app`` on first use.
+
+    Importing a router pulls in its models and dependencies (numpy for analytics, for
+    instance), so a worker only pays for the routes it actually serves.
+    """
+
+    def __init__(self, app: FastAPI, routers: dict):
+        self.app = app
+        self.routers = routers
+        self.loaded = set()
+
+    def load(self, prefix: str):
+        if prefix in self.loaded:
+            return
+        module = importlib.import_module(self.routers[prefix])
+        self.app.include_router(module.router, prefix=prefix)
+        self.loaded.add(prefix)
+        # The schema only lists routes included when it was first generated
+        self.app.openapi_schema = None
+        logger.info(f"Loaded {self.routers[prefix]} at {prefix}")
+
+    def load_all(self):
+        for prefix in self.routers:
+            self.load(prefix)
+
+    async def load_in_thread(self, prefix: str):
+        """Import the router on a worker thread, so the event loop keeps serving other
+        requests meanwhile, then include it on the loop."""
+        if prefix in self.loaded:
+            return
+        await asyncio.to_thread(importlib.import_module, self.routers[prefix])
+        # Concurrent first requests may all get here; load() includes the router only once
+        self.load(prefix)
+
+    def prefixes_for(self, path: str) -> list:
+        if path in (self.app.openapi_url, self.app.docs_url, self.app.redoc_url):
+            return list(self.routers)
+        return [prefix for prefix in self.routers if path == prefix or path.startswith(prefix + "/")][:1]
+
+
+class LazyRouterMiddleware:
+    """ASGI middleware that includes the router a request is for before it is routed."""
+
+    def __init__(self, app, routers: LazyRouters):
+        self.app = app
+        self.routers = routers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for prefix in self.routers.prefixes_for(scope["path"]):
+                await self.routers.load_in_thread(prefix)
+        await self.app(scope, receive, send)
@@ -1,8 +1,69 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routes import auth, workouts, calories
+from contextlib import asynccontextmanager
+from services import db as mongo
+from services.metrics import MetricsMiddleware, render_metrics
+from responses import BSONResponse, BSONRoute
+from lazy_routes import LazyRouters, LazyRouterMiddleware
+import logging
+import os
 
-app = FastAPI()
+logging.basicConfig(level=logging.INFO)
+
+# Router modules by prefix. They are imported on the first request under their prefix,
+# or at startup when PRELOAD_ROUTERS is set.
+ROUTERS = {
+    "/auth": "routes.auth",
+    "/workouts": "routes.workouts",
+    "/calories": "routes.calories",
+    "/analytics": "routes.analytics",
+    "/dashboard": "routes.dashboard",
+    "/export": "routes.export",
+    "/import": "routes.imports",
+}
+PRELOAD_ROUTERS = os.getenv("PRELOAD_ROUTERS", "").lower() in ("1", "true", "yes")
+
+
+def create_sweeper():
+    from services import profiles, workout_templates, nutrition, dashboard
+    from services.session_tokens import session_cache
+    from services.maintenance import Sweeper
+    return Sweeper(caches={
+        "session": session_cache,
+        "profile": profiles.profile_cache,
+        "dashboard": dashboard.dashboard_cache,
+        "workout": workout_templates.template_cache,
+        "macro": nutrition.macro_cache,
+        "macro_target": nutrition.target_cache,
+    })
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Services only the lifespan and the stats endpoints use are imported here rather
+    # than at the top, so importing the app stays cheap; the routers import the rest
+    from services.indexes import ensure_indexes
+    from services.hashing import password_hasher
+    from services.derived_updates import derived_queue, recover_pending_workouts
+    if PRELOAD_ROUTERS:
+        routers.load_all()
+    app.state.mongo = await mongo.connect()
+    await ensure_indexes(mongo.get_database())
+    derived_queue.start()
+    await recover_pending_workouts()
+    app.state.sweeper = create_sweeper()
+    app.state.sweeper.start()
+    yield
+    await app.state.sweeper.stop()
+    # Anything still queued at the timeout is recovered from derived_pending on the next start
+    await derived_queue.drain(timeout=float(os.getenv("DERIVED_QUEUE_DRAIN_TIMEOUT", "30")))
+    password_hasher.shutdown()
+    mongo.close()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=BSONResponse)
+app.router.route_class = BSONRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,13 +71,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+routers = LazyRouters(app, ROUTERS)
+app.add_middleware(LazyRouterMiddleware, routers=routers)
+# Outermost, so latency covers CORS handling and streamed bodies
+app.add_middleware(MetricsMiddleware)
 
-app.include_router(auth.router, prefix="/auth")
-app.include_router(workouts.router, prefix="/workouts")
-app.include_router(calories.router, prefix="/calories")
 
 
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
+
+
+@app.get("/db_pool")
+async def get_db_pool_stats():
+    return mongo.pool_metrics.stats()
+
+
+@app.get("/maintenance")
+async def get_maintenance_stats(request: Request):
+    sweeper = getattr(request.app.state, "sweeper", None)
+    return sweeper.stats() if sweeper else {"running": False}
+
+
+@app.get("/derived_queue")
+async def get_derived_queue_stats():
+    from services.derived_updates import derived_queue
+    return derived_queue.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request latency, per-request Mongo round trips and command totals in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,59 @@
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+from bson import Decimal128, ObjectId
+from typing import Any, Callable
+import functools
+import inspect
+import orjson
+
+
+def _default(value):
+    # orjson handles datetimes, dicts, lists and numbers natively; only BSON types need help
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    return jsonable_encoder(value)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class BSONResponse(JSONResponse):
+    """JSON response rendered with orjson that encodes ObjectId and datetime values directly,
+    so routes can return Mongo documents as-is."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _render_with_bson(endpoint: Callable) -> Callable:
+    # FastAPI passes plain return values through jsonable_encoder, which walks every document
+    # in Python and cannot encode ObjectId. Wrapping the result in a response skips that pass.
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            result = await endpoint(*args, **kwargs)
+            return result if isinstance(result, Response) else BSONResponse(result)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            result = endpoint(*args, **kwargs)
+            return result if isinstance(result, Response) else BSONResponse(result)
+    return wrapper
+
+
+class BSONRoute(APIRoute):
+    """Route class that renders endpoint results with BSONResponse.
+
+    Routes declaring a response_model keep FastAPI's validation and serialization.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        response_model = kwargs.get("response_model")
+        if response_model is None or isinstance(response_model, DefaultPlaceholder):
+            endpoint = _render_with_bson(endpoint)
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,131 @@
+from services.db import exercise_history_collection
+from services.personal_records import get_personal_records
+from responses import BSONRoute
+from fastapi import APIRouter, HTTPException, Query
+from typing import Literal
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=BSONRoute)
+
+TrainingType = Literal["hypertrophy", "strength"]
+
+def weight_multipliers(start_weight: float, weights: np.ndarray) -> np.ndarray:
+    # +10% per 2kg increase over the first logged set
+    return 1 + 0.10 * np.floor((weights - start_weight) / 2)
+
+
+def rep_multipliers(reps: np.ndarray, training_type: TrainingType) -> np.ndarray:
+    if training_type == "hypertrophy":
+        return np.select(
+            [reps <= 2, reps == 3, reps == 4, reps == 5, reps == 6, reps == 7, reps == 8],
+            [0.7, 0.8, 0.9, 0.95, 1.0, 1.06, 1.09],
+            # small diminishing returns after 8
+            default=1.10 + (reps - 8) * 0.005
+        )
+    return np.select(
+        [reps <= 0, reps == 1, reps == 2, reps == 3, reps == 4, reps == 5],
+        [1.0, 0.9, 0.95, 1.0, 1.05, 1.08],
+        # very small diminishing returns after 5
+        default=1.08 + (reps - 5) * 0.003
+    )
+
+
+def downsample(scores: np.ndarray, points: int) -> np.ndarray:
+    """Pick at most ``points`` indices, keeping the best-scoring set of each bucket."""
+    n = len(scores)
+    if n <= points:
+        return np.arange(n)
+    buckets = np.arange(n) * points // n
+    # Sort by bucket, then by descending score, and take the first row of every bucket
+    order = np.lexsort((-scores, buckets))
+    firsts = np.flatnonzero(np.diff(buckets[order], prepend=-1))
+    return order[firsts]
+
+
+def overload_series(history: dict, training_type: TrainingType, points: int) -> list:
+    """Score every set of an exercise's columnar history and return the downsampled chart series."""
+    # Missing kg/reps are stored as null, which becomes NaN
+    weights = np.array(history.get("kg", []), dtype=float)
+    reps = np.nan_to_num(np.array(history.get("reps", []), dtype=float))
+
+    # Sets without a usable weight cannot be scored
+    valid = ~np.isnan(weights)
+    if not valid.any():
+        return []
+    indices = np.flatnonzero(valid)
+    weights, reps = weights[valid], reps[valid]
+
+    scores = 100 * weight_multipliers(weights[0], weights) * rep_multipliers(reps, training_type)
+    # The standard starts at 100 and increases by 15 each session
+    standards = 100 + np.arange(len(scores)) * 15
+
+    return [
+        {
+            "session": int(i) + 1,
+            "score": float(scores[i]),
+            "standard": int(standards[i]),
+            "weight": float(weights[i]),
+            "reps": int(reps[i]),
+            "completedAt": history["completed_at"][indices[i]]
+        }
+        for i in downsample(scores, points)
+    ]
+
+
+@router.get("/exercises/{user_id}")
+async def get_exercise_names(user_id: str):
+    try:
+        histories = exercise_history_collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "exercise": 1}
+        ).sort("_id", 1)
+        return [history["exercise"] async for history in histories]
+    except Exception as e:
+        logger.error(f"Error getting exercise names: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get exercise names")
+
+
+@router.get("/overload/{user_id}")
+async def get_overload(
+    user_id: str,
+    exercise: str,
+    training_type: TrainingType = "hypertrophy",
+    points: int = Query(60, ge=2, le=500)
+):
+    try:
+        history = await exercise_history_collection.find_one(
+            {"user_id": user_id, "exercise": exercise},
+            {"_id": 0, "kg": 1, "reps": 1, "completed_at": 1}
+        )
+        if not history:
+            raise HTTPException(status_code=404, detail="Exercise not found")
+
+        return {
+            "exercise": exercise,
+            "training_type": training_type,
+            "total_sets": len(history.get("kg", [])),
+            "series": overload_series(history, training_type, points)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing overload scores: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to compute overload scores")
+
+
+@router.get("/records/{user_id}")
+async def get_exercise_records(user_id: str, exercise: str):
+    """Heaviest set, best volume set, estimated 1RMs and rep maxes for one exercise."""
+    try:
+        records = await get_personal_records(user_id, exercise)
+        if not records:
+            raise HTTPException(status_code=404, detail="No records for this exercise")
+        return records
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting personal records: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get personal records")
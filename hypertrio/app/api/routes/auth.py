@@ -1,17 +1,20 @@
 from fastapi import APIRouter, Body, HTTPException
+from responses import BSONRoute
 from pydantic import BaseModel
-from passlib.hash import argon2
 from services.db import users_collection, sessions_collection
+from services.hashing import password_hasher, PasswordHasherBusy
+from services.profiles import get_user_profile, invalidate_user_profile
+from services import session_tokens
+from services.session_tokens import InvalidSessionToken, is_signed_token, revoked_sessions, session_cache
+from services.dashboard import invalidate_dashboard
 import logging
-import os
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 class LoginRequest(BaseModel):
     email: str
@@ -44,7 +47,10 @@ async def register_user(request: RegisterRequest):
     existing_user = await users_collection.find_one({"email": email})
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
-    hashed_password = argon2.hash(password)
+    try:
+        hashed_password = await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please try again")
     user_data = {
         "name": name,
         "email": email,
@@ -74,25 +80,29 @@ async def login_user(request: LoginRequest):
     
     # Verify password
     try:
-        logger.info(f"Verifying password for user: {email}")
         stored_password = user["password"]
-        logger.info(f"Stored password hash: {stored_password[:10]}...")
-        
-        # Use argon2.verify to check the password
-        is_valid = argon2.verify(password, stored_password)
-        logger.info(f"Password verification result: {is_valid}")
+
+        # Verify on the hashing pool so the event loop keeps serving other requests
+        is_valid = await password_hasher.verify(password, stored_password)
         
         if not is_valid:
             logger.error(f"Invalid password for user: {email}")
             raise HTTPException(status_code=401, detail="Invalid credentials")
+    except PasswordHasherBusy:
+        logger.error(f"Password hashing queue full, rejecting login for: {email}")
+        raise HTTPException(status_code=503, detail="Server busy, please try again")
     except Exception as e:
         logger.error(f"Password verification error: {str(e)}")
         raise HTTPException(status_code=401, detail=f"Authentication error: {str(e)}")
 
     # Create new session
     user_id = str(user["_id"])
-    session_data = create_session(user_id)
-    await sessions_collection.insert_one(session_data)
+    if session_tokens.SESSION_MODE == "signed":
+        session_id = session_tokens.session_signer.issue(user_id)
+    else:
+        session_data = create_session(user_id)
+        await sessions_collection.insert_one(session_data)
+        session_id = session_data["sessionId"]
 
     # Return user data with session ID
     logger.info(f"Login successful for user: {email}")
@@ -100,12 +110,42 @@ async def login_user(request: LoginRequest):
         "_id": user_id,
         "email": user["email"],
         "name": user.get("name", ""),
-        "sessionId": session_data["sessionId"]
+        "sessionId": session_id
+    }
+
+def verify_signed_session(session_id: str, check_expiry: bool = True) -> dict:
+    if session_tokens.session_signer is None:
+        raise HTTPException(status_code=401, detail="Invalid session")
+    try:
+        return session_tokens.session_signer.verify(session_id, check_expiry=check_expiry)
+    except InvalidSessionToken as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+async def validate_signed_session(session_id: str):
+    # Checked without touching Sessions; the profile normally comes from the profile cache
+    claims = verify_signed_session(session_id)
+    if await revoked_sessions.is_revoked(claims["jti"]):
+        raise HTTPException(status_code=401, detail="Invalid session")
+    user = await get_user_profile(claims["sub"])
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {
+        "_id": user["_id"],
+        "email": user["email"],
+        "name": user.get("name", ""),
+        "role": claims["role"],
+        "sessionId": session_id
     }
 
 @router.get("/session/{session_id}")
 async def validate_session(session_id: str):
     """Validate a session and return user data"""
+    if is_signed_token(session_id):
+        return await validate_signed_session(session_id)
+    cached = session_cache.get(session_id)
+    if cached:
+        return cached
+
     session = await sessions_collection.find_one({"sessionId": session_id})
     if not session:
         raise HTTPException(status_code=401, detail="Invalid session")
@@ -116,23 +156,48 @@ async def validate_session(session_id: str):
     user = await users_collection.find_one({"_id": ObjectId(session["userId"])})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return {
+    session_user = {
         "_id": str(user["_id"]),
         "email": user["email"],
         "name": user.get("name", ""),
         "role": session["role"],
         "sessionId": session_id
     }
-    
+    # expiresAt is stored as naive UTC
+    expires_at = session["expiresAt"].replace(tzinfo=timezone.utc).timestamp()
+    session_cache.set(session_id, session_user, expires_at=expires_at)
+    return session_user
+
+@router.delete("/session/{session_id}")
+async def logout(session_id: str):
+    """End a session"""
+    if is_signed_token(session_id):
+        try:
+            claims = verify_signed_session(session_id, check_expiry=False)
+        except HTTPException:
+            raise HTTPException(status_code=404, detail="Session not found")
+        await revoked_sessions.revoke(claims["jti"], claims["exp"])
+        return {"sessionId": session_id}
+    session_cache.invalidate(session_id)
+    result = await sessions_collection.delete_one({"sessionId": session_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"sessionId": session_id}
+
+@router.get("/session_cache")
+async def get_session_cache_stats():
+    return session_cache.stats()
+
+@router.get("/password_hasher")
+async def get_password_hasher_stats():
+    return password_hasher.stats()
+
 @router.get("/user/{user_id}")
 async def get_user(user_id: str):
     try:
         user = await users_collection.find_one({"_id": ObjectId(user_id)})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        
-        # Convert ObjectId to string for JSON response
-        user["_id"] = str(user["_id"])
         return user
     except Exception as e:
         logger.error(f"Error fetching user: {str(e)}")
@@ -148,6 +213,10 @@ async def update_user(user_id: str, user_update: dict):
             {"_id": ObjectId(user_id)},
             {"$set": user_update}
         )
+        # Cached sessions embed the user's name and email
+        session_cache.invalidate_where(lambda session_user: session_user["_id"] == user_id)
+        invalidate_user_profile(user_id)
+        invalidate_dashboard(user_id)
 
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
@@ -156,9 +225,6 @@ async def update_user(user_id: str, user_update: dict):
         updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
         if not updated_user:
             raise HTTPException(status_code=404, detail="User not found")
-
-        # Convert ObjectId to string for JSON response
-        updated_user["_id"] = str(updated_user["_id"])
         return updated_user
     except Exception as e:
         logger.error(f"Error updating user: {str(e)}")
@@ -1,45 +1,103 @@
-from services.db import calories_collection, users_collection
-from fastapi import APIRouter, HTTPException
+from services.db import calories_collection
+from services.profiles import get_user_profile
+from services.dashboard import invalidate_dashboard
+from services.nutrition import ACTIVITY_LEVELS, GOAL_ADJUSTMENTS, calorie_goal_for, evaluate_scenarios, get_user_macros, save_user_macros
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from responses import BSONRoute, dumps
 from datetime import datetime, timedelta
-from bson import ObjectId
-from pydantic import BaseModel
-from typing import Dict, List
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pydantic import BaseModel, field_validator
+from typing import Dict, List, Literal, Optional
 import logging
 from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
+
+MAX_BATCH_ENTRIES = 1000
+MAX_SCENARIOS = 10000
 
 class FoodEntry(BaseModel):
     name: str
     calories: int
-    timestamp: datetime
+    timestamp: Optional[datetime] = None  # Defaults to now; naive timestamps are taken as UTC
 
 class CalorieRequest(BaseModel):
     food: str
     calories: int
 
+class CalorieBatchRequest(BaseModel):
+    entries: List[FoodEntry]
+
+class MacroProfile(BaseModel):
+    weight_kg: float
+    height_cm: float
+    age: int
+    sex: Literal["male", "female"]
+    activity: Literal[tuple(ACTIVITY_LEVELS)] = "sedentary"
+    goal: Literal[tuple(GOAL_ADJUSTMENTS)] = "maintain"
+
+    @field_validator("weight_kg", "height_cm", "age")
+    @classmethod
+    def positive(cls, value):
+        if value <= 0:
+            raise ValueError("must be positive")
+        return value
+
+class MacroScenarioRequest(BaseModel):
+    profiles: List[MacroProfile]
+    # Evaluate every profile under each of these; omitted, each profile keeps its own
+    activities: Optional[List[Literal[tuple(ACTIVITY_LEVELS)]]] = None
+    goals: Optional[List[Literal[tuple(GOAL_ADJUSTMENTS)]]] = None
+
+def day_start_of(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+# $dateToString formats whose output sorts chronologically and identifies each bucket
+BUCKET_FORMATS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",  # ISO week, starting Monday
+    "month": "%Y-%m",
+}
+
+def bucket_start(bucket: str, key: str) -> datetime:
+    if bucket == "week":
+        year, week = key.split("-W")
+        start = datetime.fromisocalendar(int(year), int(week), 1)
+    else:
+        start = datetime.strptime(key, BUCKET_FORMATS[bucket])
+    return start.replace(tzinfo=timezone.utc)
+
+def range_pipeline(user_id: str, start: datetime, end: datetime, bucket: str) -> list:
+    return [
+        {"$match": {"user_id": user_id, "date": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {"$dateToString": {"date": "$date", "format": BUCKET_FORMATS[bucket]}},
+            "total_calories": {"$sum": "$total_calories"},
+            "average_goal": {"$avg": "$calorie_goal"},
+            "days_logged": {"$sum": 1},
+            "days_within_goal": {"$sum": {"$cond": [{"$lte": ["$total_calories", "$calorie_goal"]}, 1, 0]}},
+            "food_count": {"$sum": {"$size": {"$ifNull": ["$food", []]}}}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
 @router.post("/log/{user_id}")
 async def log_calories(user_id: str, request: CalorieRequest):
     try:
         # Get user's calorie goal
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await get_user_profile(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        calorie_goal = user.get('calorie_goal', 2000)
+        calorie_goal = await calorie_goal_for(user_id, user)
         
         # Get the start of the current day in UTC
         now = datetime.now(timezone.utc)
-        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        
-        # Try to find an existing entry for today
-        today_entry = await calories_collection.find_one({
-            "user_id": user_id,
-            "date": {"$gte": day_start, "$lt": day_end}
-        })
+        day_start = day_start_of(now)
         
         # Create the food entry with the name field
         new_food_entry = {
@@ -48,42 +106,99 @@ async def log_calories(user_id: str, request: CalorieRequest):
             "timestamp": now
         }
         
-        if today_entry:
-            # Update existing entry
-            await calories_collection.update_one(
-                {"_id": today_entry["_id"]},
-                {
-                    "$push": {"food": new_food_entry},
-                    "$inc": {"total_calories": request.calories}
-                }
+        # Append to today's entry in one round trip, creating it if this is the first log of the day.
+        # The unique (user_id, date) index keeps concurrent first logs from creating two documents.
+        day_filter = {"user_id": user_id, "date": day_start}
+        day_update = {
+            "$push": {"food": new_food_entry},
+            "$inc": {"total_calories": request.calories},
+            "$setOnInsert": {"calorie_goal": calorie_goal}
+        }
+        try:
+            entry = await calories_collection.find_one_and_update(
+                day_filter, day_update, upsert=True, return_document=ReturnDocument.AFTER
             )
-            updated_entry = await calories_collection.find_one({"_id": today_entry["_id"]})
-            updated_entry["_id"] = str(updated_entry["_id"])
-            return updated_entry
-        else:
-            # Create new entry for today
-            new_entry = {
-                "user_id": user_id,
-                "date": day_start,
-                "food": [new_food_entry],
-                "total_calories": request.calories,
-                "calorie_goal": calorie_goal
-            }
-            result = await calories_collection.insert_one(new_entry)
-            created_entry = await calories_collection.find_one({"_id": result.inserted_id})
-            created_entry["_id"] = str(created_entry["_id"])
-            return created_entry
+        except DuplicateKeyError:
+            # Lost the insert race to a concurrent log; the document exists now, so this is an update
+            entry = await calories_collection.find_one_and_update(
+                day_filter, day_update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        invalidate_dashboard(user_id)
+        return entry
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error logging calories: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/log/{user_id}/batch")
+async def log_calories_batch(user_id: str, request: CalorieBatchRequest):
+    try:
+        if not request.entries:
+            raise HTTPException(status_code=400, detail="No food entries provided")
+        if len(request.entries) > MAX_BATCH_ENTRIES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ENTRIES} entries per batch")
+
+        user = await get_user_profile(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        calorie_goal = await calorie_goal_for(user_id, user)
+
+        # Group the entries by the UTC day they were eaten on
+        now = datetime.now(timezone.utc)
+        days: Dict[datetime, List[dict]] = {}
+        for entry in request.entries:
+            timestamp = entry.timestamp or now
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            timestamp = timestamp.astimezone(timezone.utc)
+            days.setdefault(day_start_of(timestamp), []).append({
+                "name": entry.name,
+                "calories": entry.calories,
+                "timestamp": timestamp
+            })
+
+        # One upsert per day, all sent in a single bulk write
+        updates = [
+            UpdateOne(
+                {"user_id": user_id, "date": day},
+                {
+                    "$push": {"food": {"$each": sorted(foods, key=lambda food: food["timestamp"])}},
+                    "$inc": {"total_calories": sum(food["calories"] for food in foods)},
+                    "$setOnInsert": {"calorie_goal": calorie_goal}
+                },
+                upsert=True
+            )
+            for day, foods in days.items()
+        ]
+        try:
+            await calories_collection.bulk_write(updates, ordered=False)
+        except BulkWriteError as e:
+            # Days whose insert lost a race to a concurrent log exist now; retry those as updates
+            failed = [error["index"] for error in e.details["writeErrors"] if error["code"] == 11000]
+            if len(failed) != len(e.details["writeErrors"]):
+                raise
+            await calories_collection.bulk_write([updates[index] for index in failed], ordered=False)
+        invalidate_dashboard(user_id)
+
+        entries = await calories_collection.find(
+            {"user_id": user_id, "date": {"$in": list(days)}}
+        ).sort("date", 1).to_list(None)
+        return entries
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error logging calorie batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/today/{user_id}")
 async def get_today_calories(user_id: str):
     try:
         # Get the start of the current day in UTC
         now = datetime.now(timezone.utc)
-        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        day_start = day_start_of(now)
         day_end = day_start + timedelta(days=1)
         
         # Find today's entry
@@ -94,7 +209,7 @@ async def get_today_calories(user_id: str):
         
         if not entry:
             # If no entry exists, get user's goal and return empty data
-            user = await users_collection.find_one({"_id": ObjectId(user_id)})
+            user = await get_user_profile(user_id)
             if not user:
                 raise HTTPException(status_code=404, detail="User not found")
             
@@ -103,16 +218,14 @@ async def get_today_calories(user_id: str):
                 "date": day_start,
                 "food": [],
                 "total_calories": 0,
-                "calorie_goal": user.get('calorie_goal', 2000)
+                "calorie_goal": await calorie_goal_for(user_id, user)
             }
             
         if entry:
-            # Convert ObjectId to string
-            entry["_id"] = str(entry["_id"])
             return entry
             
         # If no entry exists, return empty data with user's goal
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await get_user_profile(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -121,9 +234,96 @@ async def get_today_calories(user_id: str):
             "date": day_start,
             "food": [],
             "total_calories": 0,
-            "calorie_goal": user.get('calorie_goal', 2000)
+            "calorie_goal": await calorie_goal_for(user_id, user)
         }
         
     except Exception as e:
         logger.error(f"Error getting today's calories: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/range/{user_id}")
+async def get_calorie_range(
+    user_id: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: Literal["day", "week", "month"] = "day"
+):
+    # Defaults to the last 30 days, including today
+    now = datetime.now(timezone.utc)
+    end = end or day_start_of(now) + timedelta(days=1)
+    start = start or end - timedelta(days=30)
+    start, end = [value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in (start, end)]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+    def summarize(row: dict) -> dict:
+        return {
+            "bucket": row["_id"],
+            "start": bucket_start(bucket, row["_id"]),
+            "total_calories": row["total_calories"],
+            "average_calories": row["total_calories"] / row["days_logged"],
+            "average_goal": row["average_goal"],
+            "days_logged": row["days_logged"],
+            "days_within_goal": row["days_within_goal"],
+            "goal_adherence": row["days_within_goal"] / row["days_logged"],
+            "food_count": row["food_count"]
+        }
+
+    try:
+        # Run the aggregation and fetch its first batch before any bytes are sent,
+        # so a failing pipeline is still reported as a 500
+        cursor = calories_collection.aggregate(range_pipeline(user_id, start, end, bucket))
+        first_row = await anext(cursor, None)
+    except Exception as e:
+        logger.error(f"Error getting calorie range: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get calorie range")
+
+    async def stream_buckets():
+        # Writes a JSON array one bucket at a time as the aggregation cursor yields them
+        yield "["
+        if first_row is not None:
+            yield dumps(summarize(first_row)).decode()
+            try:
+                async for row in cursor:
+                    yield "," + dumps(summarize(row)).decode()
+            except Exception as e:
+                # Headers are already sent, so the truncated array is the only error signal left
+                logger.error(f"Error streaming calorie range: {str(e)}")
+                return
+        yield "]"
+
+    return StreamingResponse(stream_buckets(), media_type="application/json")
+
+
+@router.post("/macros/scenarios")
+async def evaluate_macro_scenarios(request: MacroScenarioRequest):
+    scenarios = len(request.profiles) * len(request.activities or [None]) * len(request.goals or [None])
+    if scenarios > MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SCENARIOS} scenarios per request")
+    return evaluate_scenarios([profile.dict() for profile in request.profiles], request.activities, request.goals)
+
+@router.post("/macros/{user_id}")
+async def save_macros(user_id: str, profile: MacroProfile):
+    try:
+        user = await get_user_profile(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        macros = await save_user_macros(user_id, profile.dict())
+        invalidate_dashboard(user_id)
+        return macros
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error saving macros: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to save macros")
+
+@router.get("/macros/{user_id}")
+async def get_macros(user_id: str):
+    try:
+        macros = await get_user_macros(user_id)
+    except Exception as e:
+        logger.error(f"Error getting macros: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get macros")
+    if not macros:
+        raise HTTPException(status_code=404, detail="No macros saved")
+    return macros
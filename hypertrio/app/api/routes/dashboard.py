@@ -0,0 +1,21 @@
+from services.dashboard import get_dashboard
+from responses import BSONRoute
+from fastapi import APIRouter, HTTPException
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=BSONRoute)
+
+@router.get("/{user_id}")
+async def get_user_dashboard(user_id: str):
+    try:
+        dashboard = await get_dashboard(user_id)
+        if not dashboard:
+            raise HTTPException(status_code=404, detail="User not found")
+        return dashboard
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting dashboard: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get dashboard")
@@ -0,0 +1,84 @@
+from services.db import completed_workouts_collection, calories_collection
+from responses import BSONRoute, dumps
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from typing import Literal
+import csv
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=BSONRoute)
+
+# Documents pulled per cursor batch and written per chunk, so memory stays flat however long the history
+EXPORT_BATCH_SIZE = 500
+
+CSV_COLUMNS = ["type", "date", "workout", "exercise", "set", "kg", "reps", "notes", "food", "calories"]
+
+
+async def export_documents(user_id: str):
+    """Yield ("workout" | "calories", document) for a user's whole history, oldest first."""
+    workouts = completed_workouts_collection.find(
+        {"user_id": user_id}, {"_id": 0, "user_id": 0, "derived_pending": 0, "derived_claimed_by": 0, "derived_claimed_until": 0}
+    ).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    async for workout in workouts:
+        yield "workout", workout
+    days = calories_collection.find(
+        {"user_id": user_id}, {"_id": 0, "user_id": 0}
+    ).sort("date", 1).batch_size(EXPORT_BATCH_SIZE)
+    async for day in days:
+        yield "calories", day
+
+
+def csv_rows(kind: str, document: dict):
+    # One row per logged set or food item
+    if kind == "workout":
+        for exercise, sets in document.get("exercises", {}).items():
+            for number, s in enumerate(sets, start=1):
+                yield {"type": "set", "date": document.get("completed_at"), "workout": document.get("workout_name"),
+                       "exercise": exercise, "set": number, "kg": s.get("kg"), "reps": s.get("reps"),
+                       "notes": s.get("notes")}
+    else:
+        for food in document.get("food", []):
+            timestamp = food.get("timestamp")
+            yield {"type": "food", "date": timestamp.isoformat() if timestamp else None, "food": food.get("name"),
+                   "calories": food.get("calories")}
+
+
+async def stream_ndjson(user_id: str):
+    chunk = []
+    async for kind, document in export_documents(user_id):
+        chunk.append(dumps({"type": kind, **document}))
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+
+async def stream_csv(user_id: str):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    documents = 0
+    async for kind, document in export_documents(user_id):
+        writer.writerows(csv_rows(kind, document))
+        documents += 1
+        if documents % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@router.get("/{user_id}")
+async def export_history(user_id: str, format: Literal["ndjson", "csv"] = "ndjson"):
+    """Stream a user's complete training and nutrition history."""
+    if format == "csv":
+        body, media_type = stream_csv(user_id), "text/csv"
+    else:
+        body, media_type = stream_ndjson(user_id), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="hypertrio-export-{user_id}.{format}"'
+    })
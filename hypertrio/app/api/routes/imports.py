@@ -0,0 +1,249 @@
+from services.db import completed_workouts_collection
+from services.exercise_history import merge_completed_workouts
+from services.personal_records import append_personal_records
+from services.derived_updates import claim_fields, clear_pending, mark_pending
+from services import workout_stats
+from services.dashboard import invalidate_dashboard
+from routes.workouts import CompletedWorkoutRequest, Set
+from responses import BSONRoute
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from typing import Literal
+import codecs
+import csv
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=BSONRoute)
+
+# Completed workouts written per insert_many
+IMPORT_BATCH_SIZE = 500
+# Per-row errors and unparsed values returned in the response; the totals are always reported
+MAX_REPORTED_ERRORS = 100
+
+CSV_REQUIRED_COLUMNS = {"date", "workout", "exercise", "kg", "reps"}
+
+
+def describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+
+
+async def body_lines(request: Request):
+    """Decode the request body into lines as it arrives."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def csv_records(lines):
+    record = None
+    async for line in lines:
+        record = line if record is None else f"{record}\n{line}"
+        # A quoted field that spans lines leaves an odd number of quotes until it closes
+        if record.count('"') % 2 == 0:
+            yield next(csv.reader([record]), [])
+            record = None
+    if record is not None:
+        yield next(csv.reader([record]), [])
+
+
+async def ndjson_workouts(lines, user_id: str):
+    """Yield (row, workout | error message | unparsed values) for every completed workout line."""
+    row = 0
+    async for line in lines:
+        row += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield row, "Expected a JSON object"
+            continue
+        # Exports interleave calorie days, which are not completed workouts
+        if record.pop("type", "workout") != "workout":
+            continue
+        try:
+            workout = CompletedWorkoutRequest(**{**record, "user_id": user_id})
+        except ValidationError as e:
+            yield row, describe(e)
+            continue
+        if unparsed := workout.unparsed_values():
+            yield row, unparsed
+        yield row, workout.dict()
+
+
+async def csv_workouts(lines, user_id: str):
+    """Yield (row, workout | error message | unparsed values), grouping consecutive rows of one session.
+
+    Uses the export's CSV layout: one row per set, sessions keyed by (date, workout).
+    """
+    records = csv_records(lines)
+    header = await anext(records, None)
+    missing = CSV_REQUIRED_COLUMNS - set(header or [])
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing CSV columns: {', '.join(sorted(missing))}")
+
+    session, session_row, exercises = None, None, {}
+    row = 0
+    async for record in records:
+        row += 1
+        if not any(record):
+            continue
+        if len(record) < len(header):
+            yield row, f"Expected {len(header)} columns, got {len(record)}"
+            continue
+        values = dict(zip(header, record))
+        if values.get("type") not in (None, "", "set"):
+            continue
+        if not (values.get("date") and values.get("workout") and values.get("exercise")):
+            yield row, "date, workout and exercise are required"
+            continue
+        try:
+            logged_set = Set(kg=values.get("kg"), reps=values.get("reps"), notes=values.get("notes") or "")
+        except ValidationError as e:
+            yield row, describe(e)
+            continue
+
+        key = (values["date"], values["workout"])
+        if key != session:
+            if exercises:
+                yield session_row, {"user_id": user_id, "completed_at": session[0], "workout_name": session[1], "exercises": exercises}
+            session, session_row, exercises = key, row, {}
+        sets = exercises.setdefault(values["exercise"], [])
+        if logged_set.unparsed:
+            yield row, [{"exercise": values["exercise"], "set": len(sets), "field": field, "value": text}
+                        for field, text in logged_set.unparsed.items()]
+        sets.append(logged_set.dict())
+    if exercises:
+        yield session_row, {"user_id": user_id, "completed_at": session[0], "workout_name": session[1], "exercises": exercises}
+
+
+class WorkoutImport:
+    """Writes imported workouts in batches and folds them into the derived collections once, at the end.
+
+    Workouts are written pending and claimed by the import, which clears them once
+    the derived collections hold them. If the process dies first, the claim lapses
+    and the maintenance sweeper applies them one by one.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        self.unparsed_count = 0
+        self.unparsed = []
+        self.batch = []
+        self.rows = []
+        # Every workout written, folded into the derived collections by update_derived
+        self.workouts = []
+
+    def fail(self, row: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def note_unparsed(self, row: int, values: list):
+        """Record set values that were imported as null because they were not numbers."""
+        self.unparsed_count += len(values)
+        for value in values[:MAX_REPORTED_ERRORS - len(self.unparsed)]:
+            self.unparsed.append({"row": row, **value})
+
+    async def add(self, row: int, workout: dict):
+        self.batch.append({**mark_pending(workout), **claim_fields()})
+        self.rows.append(row)
+        if len(self.batch) >= IMPORT_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if not self.batch:
+            return
+        failed = set()
+        try:
+            await completed_workouts_collection.insert_many(self.batch, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                failed.add(write_error["index"])
+                self.fail(self.rows[write_error["index"]], write_error.get("errmsg", "Write failed"))
+        for index, workout in enumerate(self.batch):
+            if index not in failed:
+                self.record(workout)
+        self.batch, self.rows = [], []
+
+    def record(self, workout: dict):
+        self.imported += 1
+        self.workouts.append({key: workout[key] for key in ("_id", "completed_at", "exercises")})
+
+    async def update_derived(self):
+        if not self.workouts:
+            return
+        workouts, self.workouts = self.workouts, []
+        # In batches, so a crash leaves at most one batch applied but still pending,
+        # well inside the window of applied ids the derived documents remember
+        for start in range(0, len(workouts), IMPORT_BATCH_SIZE):
+            batch = workouts[start:start + IMPORT_BATCH_SIZE]
+            # Imported sessions usually predate the stored history, so they are merged in by date
+            await merge_completed_workouts(self.user_id, batch)
+            sets_by_exercise = {}
+            for workout in batch:
+                for exercise_name, sets in workout["exercises"].items():
+                    sets_by_exercise.setdefault(exercise_name, []).extend(
+                        {**s, "completed_at": workout["completed_at"]} for s in sets
+                    )
+            await append_personal_records(self.user_id, sets_by_exercise)
+            await workout_stats.record_sessions(self.user_id, batch)
+            await clear_pending([workout["_id"] for workout in batch])
+        invalidate_dashboard(self.user_id)
+
+    async def finish(self) -> dict:
+        await self.flush()
+        await self.update_derived()
+        return {
+            "imported": self.imported,
+            "failed": self.error_count,
+            "errors": self.errors,
+            "unparsed": self.unparsed_count,
+            "unparsed_values": self.unparsed,
+        }
+
+
+@router.post("/{user_id}")
+async def import_completed_workouts(user_id: str, request: Request, format: Literal["ndjson", "csv"] = "ndjson"):
+    """
+    Import completed workouts from the raw request body, parsed as it streams in.
+    Accepts the export's NDJSON (one completed workout per line) or CSV (one set per row) layout.
+    """
+    parse = csv_workouts if format == "csv" else ndjson_workouts
+    workout_import = WorkoutImport(user_id)
+    try:
+        async for row, result in parse(body_lines(request), user_id):
+            if isinstance(result, str):
+                workout_import.fail(row, result)
+            elif isinstance(result, list):
+                workout_import.note_unparsed(row, result)
+            else:
+                await workout_import.add(row, result)
+        return await workout_import.finish()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error importing completed workouts: {str(e)}")
+        try:
+            # Workouts written before the failure still need their history and stats
+            await workout_import.update_derived()
+        except Exception as e:
+            logger.error(f"Error updating derived data after a failed import: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to import completed workouts")
@@ -1,14 +1,27 @@
-from services.db import workouts_collection, completed_workouts_collection
-from fastapi import APIRouter, HTTPException
-from datetime import datetime
+from services.db import workouts_collection, completed_workouts_collection, exercise_history_collection
+from services.derived_updates import mark_pending, submit_derived_updates
+from services import workout_stats
+from services.dashboard import invalidate_dashboard
+from services.workout_templates import get_workout_template, invalidate_workout_template, template_cache
+from services.sets import SET_COLUMNS, parse_input_number, parse_input_reps, to_rows
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from responses import BSONResponse, BSONRoute, dumps
+from datetime import datetime, timezone
 from bson import ObjectId
-from pydantic import BaseModel
-from typing import Dict, List
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Optional
+import base64
+import hashlib
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
+
+MAX_PAGE_SIZE = 500
+# Fields a caller may ask get_workouts to project; _id is always returned
+WORKOUT_FIELDS = {"name", "exercises", "user_id", "created_at", "updated_at"}
 
 class WorkoutRequest(BaseModel):
     name: str
@@ -16,9 +29,30 @@ class WorkoutRequest(BaseModel):
     user_id: str
 
 class Set(BaseModel):
-    kg: str
-    reps: str
-    notes: str
+    # Clients send the text typed into the set inputs; it is stored as numbers, and empty inputs as null
+    kg: Optional[float] = None
+    reps: Optional[int] = None
+    notes: str = ""
+    # Text that was not a number, such as "BW", by field. It is stored as null, kept in
+    # the notes and reported back instead of rejecting the whole workout
+    unparsed: Dict[str, str] = Field(default_factory=dict, exclude=True)
+
+    @model_validator(mode="before")
+    @classmethod
+    def numbers(cls, values):
+        if not isinstance(values, dict):
+            return values
+        values = {**values, "unparsed": {}}
+        for field, parse in (("kg", parse_input_number), ("reps", parse_input_reps)):
+            try:
+                values[field] = parse(values.get(field))
+            except ValueError:
+                values["unparsed"][field] = str(values[field])
+                values[field] = None
+        if values["unparsed"]:
+            kept = [f"{field}: {text}" for field, text in values["unparsed"].items()]
+            values["notes"] = "; ".join(filter(None, [values.get("notes") or "", *kept]))
+        return values
 
 class CompletedWorkoutRequest(BaseModel):
     user_id: str
@@ -26,6 +60,15 @@ class CompletedWorkoutRequest(BaseModel):
     exercises: Dict[str, List[Set]]
     completed_at: str
 
+    def unparsed_values(self) -> list:
+        """Set values that were not numbers, one entry per field."""
+        return [
+            {"exercise": exercise_name, "set": index, "field": field, "value": text}
+            for exercise_name, sets in self.exercises.items()
+            for index, logged_set in enumerate(sets)
+            for field, text in logged_set.unparsed.items()
+        ]
+
 @router.post("/workouts")
 async def add_workout(workout: WorkoutRequest):
     try:
@@ -36,50 +79,123 @@ async def add_workout(workout: WorkoutRequest):
             "created_at": datetime.now()
         }
         result = await workouts_collection.insert_one(workout_data)
+        await workout_stats.adjust_template_count(workout.user_id, 1)
+        invalidate_dashboard(workout.user_id)
         return {"id": str(result.inserted_id)}
     except Exception as e:
-        print(f"Error adding workout: {str(e)}")
+        logger.error(f"Error adding workout: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to add workout")
 
+def encode_cursor(workout: dict) -> str:
+    # Legacy workouts without created_at sort first, before any timestamp, in _id order
+    created_at = workout.get("created_at")
+    position = {"created_at": created_at.isoformat() if created_at else None, "_id": str(workout["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = position["created_at"]
+        return datetime.fromisoformat(created_at) if created_at else None, ObjectId(position["_id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/workouts/{user_id}")
-async def get_workouts(user_id: str):
+async def get_workouts(
+    user_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Page through a user's workouts in (created_at, _id) order.
+    The next page's cursor is returned in the X-Next-Cursor header, absent on the last page.
+    """
+    query = {"user_id": user_id}
+    if cursor:
+        created_at, workout_id = decode_cursor(cursor)
+        if created_at is None:
+            query["$or"] = [
+                {"created_at": None, "_id": {"$gt": workout_id}},
+                {"created_at": {"$ne": None}}
+            ]
+        else:
+            query["$or"] = [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "_id": {"$gt": workout_id}}
+            ]
+
+    projection = None
+    if fields:
+        requested = set(fields.split(","))
+        if not requested <= WORKOUT_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(requested - WORKOUT_FIELDS))}")
+        # The sort keys are always fetched so the next cursor can be built
+        projection = {field: 1 for field in requested | {"created_at"}}
+
     try:
-        # Fetch workouts for the specified user
-        workouts = await workouts_collection.find({"user_id": user_id}).to_list(100)
-        # Convert ObjectId to string for JSON serialization
-        serialized_workouts = []
-        for workout in workouts:
-            workout['_id'] = str(workout['_id'])  # Convert ObjectId to string
-            serialized_workouts.append(workout)
-        return serialized_workouts
+        # Fetch one extra workout to learn whether another page exists
+        workouts = await workouts_collection.find(query, projection).sort(
+            [("created_at", 1), ("_id", 1)]
+        ).limit(limit + 1).to_list(limit + 1)
     except Exception as e:
-        print(f"Error getting workouts: {str(e)}")
+        logger.error(f"Error getting workouts: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get workouts")
 
+    has_more = len(workouts) > limit
+    workouts = workouts[:limit]
+    if has_more:
+        response.headers["X-Next-Cursor"] = encode_cursor(workouts[-1])
+    if fields and "created_at" not in requested:
+        for workout in workouts:
+            workout.pop("created_at", None)
+
+    # Unchanged pages revalidate with a 304 instead of resending the body
+    body = dumps(workouts)
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=dict(response.headers))
+    return Response(content=body, media_type=BSONResponse.media_type, headers=dict(response.headers))
+
 @router.get("/workouts/{user_id}/{workout_name}")
-async def get_workout(user_id: str, workout_name: str):
+async def get_workout_by_name(user_id: str, workout_name: str):
     try:
         # Fetch specific workout for the user
         workout = await workouts_collection.find_one({"user_id": user_id, "name": workout_name})
         if not workout:
             raise HTTPException(status_code=404, detail="Workout not found")
-        
-        workout['_id'] = str(workout['_id'])  # Convert ObjectId to string
         return workout
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error getting workout: {str(e)}")
+        logger.error(f"Error getting workout: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get workout")
 
-@router.get("/workouts/{workout_id}")
+def parse_workout_id(workout_id: str) -> ObjectId:
+    if not ObjectId.is_valid(workout_id):
+        raise HTTPException(status_code=400, detail="Invalid workout id")
+    return ObjectId(workout_id)
+
+# /workouts/{workout_id} would be shadowed by get_workouts, so the by-id fetch has its own path
+@router.get("/workout/{workout_id}")
 async def get_workout(workout_id: str):
+    object_id = parse_workout_id(workout_id)
     try:
-        workout = await workouts_collection.find_one({"_id": ObjectId(workout_id)})
-        if not workout:
-            raise HTTPException(status_code=404, detail="Workout not found")
-        return workout
+        workout = await get_workout_template(object_id)
     except Exception as e:
         logger.error(f"Error getting workout: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get workout")
+    if not workout:
+        raise HTTPException(status_code=404, detail="Workout not found")
+    return workout
+
+@router.get("/workout_cache")
+async def get_workout_cache_stats():
+    return template_cache.stats()
 
 @router.put("/workouts/{workout_id}")
 async def update_workout(workout_id: str, workout: WorkoutRequest):
@@ -93,6 +209,7 @@ async def update_workout(workout_id: str, workout: WorkoutRequest):
             "updated_at": datetime.now()
         }
         result = await workouts_collection.update_one({"_id": object_id}, {"$set": workout_data})
+        invalidate_workout_template(object_id)
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Workout not found")
         return {"name": workout.name, "exercises": workout.exercises}
@@ -103,8 +220,12 @@ async def update_workout(workout_id: str, workout: WorkoutRequest):
 @router.post("/completed")
 async def save_completed_workout(workout: CompletedWorkoutRequest):
     try:
-        await completed_workouts_collection.insert_one(workout.dict())
-        
+        workout_data = mark_pending(workout.dict())
+        await completed_workouts_collection.insert_one(workout_data)
+        # History, records and stats are brought up to date after the response; if the
+        # queue is full the workout stays derived_pending for the maintenance sweeper
+        await submit_derived_updates(workout_data)
+        return {"unparsed": workout.unparsed_values()}
     except Exception as e:
         logger.error(f"Error saving completed workout: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to save completed workout")
@@ -112,9 +233,12 @@ async def save_completed_workout(workout: CompletedWorkoutRequest):
 @router.delete("/workouts/{workout_id}")
 async def delete_workout(workout_id: str):
     try:
-        result = await workouts_collection.delete_one({"_id": ObjectId(workout_id)})
-        if result.deleted_count == 0:
+        deleted = await workouts_collection.find_one_and_delete({"_id": ObjectId(workout_id)}, {"user_id": 1})
+        if not deleted:
             raise HTTPException(status_code=404, detail="Workout not found")
+        invalidate_workout_template(deleted["_id"])
+        await workout_stats.adjust_template_count(deleted["user_id"], -1)
+        invalidate_dashboard(deleted["user_id"])
         return {"id": workout_id}
     except Exception as e:
         logger.error(f"Error deleting workout: {str(e)}")
@@ -124,19 +248,14 @@ async def delete_workout(workout_id: str):
 @router.get("/exercises/{user_id}")
 async def get_user_exercises(user_id: str):
     try:
-        user_workouts = await completed_workouts_collection.find({"user_id": user_id}).to_list(None)
+        # Read the pre-aggregated per-exercise history rather than replaying every workout
+        histories = exercise_history_collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "exercise": 1, **{column: 1 for column in SET_COLUMNS}}
+        ).sort("_id", 1)
         exercise_dict = {}
-
-        for workout in user_workouts:
-            completed_at = workout.get("completed_at")
-            exercises = workout.get("exercises", {})
-            for exercise_name, sets in exercises.items():
-                if exercise_name not in exercise_dict:
-                    exercise_dict[exercise_name] = []
-                for s in sets:
-                    # Attach the completed_at timestamp to each set
-                    s_with_timestamp = {**s, "completed_at": completed_at}
-                    exercise_dict[exercise_name].append(s_with_timestamp)
+        async for history in histories:
+            exercise_dict[history["exercise"]] = to_rows(history)
 
         return exercise_dict
     except Exception as e:
@@ -147,9 +266,23 @@ async def get_user_exercises(user_id: str):
 @router.get("/workouts_count/{user_id}")
 async def get_workouts_count(user_id: str):
     try:
-        # Fetch workouts for the specified user
-        workouts = await workouts_collection.find({"user_id": user_id}).to_list(100)
-        return len(workouts)
+        stats = await workout_stats.get_workout_stats(user_id)
+        return stats["workout_count"]
     except Exception as e:
         logger.error(f"Error getting workouts count: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get workouts count")
+
+
+@router.get("/stats/{user_id}")
+async def get_user_workout_stats(user_id: str):
+    try:
+        stats = await workout_stats.get_workout_stats(user_id)
+        return {
+            "template_count": stats["workout_count"],
+            "completed_count": stats["completed_count"],
+            "last_completed_at": stats.get("last_completed_at"),
+            "weekly_streak": workout_stats.weekly_streak(stats["active_weeks"], datetime.now(timezone.utc))
+        }
+    except Exception as e:
+        logger.error(f"Error getting workout stats: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get workout stats")
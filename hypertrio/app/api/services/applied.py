@@ -0,0 +1,16 @@
+import os
+
+# Derived documents (exercise histories, user stats) remember the most recent workouts
+# folded into them, so replaying one after a retry or a crash is a no-op. A workout can
+# only be replayed while it is still derived_pending, which is never more than a lease
+# and a sweeper pass after it was applied, so only that many recent ids need keeping.
+APPLIED_WINDOW = int(os.getenv("DERIVED_APPLIED_WINDOW", "1000"))
+
+
+def not_applied(workout_id) -> dict:
+    return {"applied_workouts": {"$ne": workout_id}}
+
+
+def push_applied(workout_ids: list) -> dict:
+    """$push entry recording workouts as applied, keeping only the newest APPLIED_WINDOW."""
+    return {"applied_workouts": {"$each": list(workout_ids), "$slice": -APPLIED_WINDOW}}
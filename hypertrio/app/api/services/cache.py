@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import time
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after a TTL.
+
+    Entries can also carry their own absolute deadline (a Unix timestamp), in
+    which case they expire at whichever comes first. The cache is per worker
+    process, so writers must invalidate entries explicitly.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        deadline, value = entry
+        if deadline <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expires_at: float | None = None):
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        self._entries[key] = (deadline, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key) -> bool:
+        return self._entries.pop(key, None) is not None
+
+    def invalidate_where(self, predicate) -> int:
+        """Drop every entry whose value matches ``predicate``; returns how many were dropped."""
+        keys = [key for key, (_, value) in self._entries.items() if predicate(value)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def purge_expired(self) -> int:
+        """Drop entries past their deadline that no lookup has touched; returns how many were dropped."""
+        now = time.time()
+        keys = [key for key, (deadline, _) in self._entries.items() if deadline <= now]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
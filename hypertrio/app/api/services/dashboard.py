@@ -0,0 +1,67 @@
+from services.db import calories_collection, exercise_history_collection
+from services.cache import TTLCache
+from services.profiles import get_user_profile
+from services.nutrition import calorie_goal_for
+from services.workout_stats import get_workout_stats, weekly_streak
+from datetime import datetime, timedelta, timezone
+import asyncio
+import os
+
+# Assembled dashboard payloads per user. Every write that changes one of its parts
+# calls invalidate_dashboard, which only reaches this worker's cache; the TTL bounds
+# how long a write handled by another worker can go unnoticed by this one. Entries
+# also never outlive the UTC day they describe.
+dashboard_cache = TTLCache(
+    maxsize=int(os.getenv("DASHBOARD_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+)
+
+
+def invalidate_dashboard(user_id: str):
+    dashboard_cache.invalidate(user_id)
+
+
+async def _today_calories(user_id: str, day_start: datetime) -> dict | None:
+    return await calories_collection.find_one(
+        {"user_id": user_id, "date": {"$gte": day_start, "$lt": day_start + timedelta(days=1)}},
+        {"_id": 0, "total_calories": 1, "calorie_goal": 1}
+    )
+
+
+async def _exercise_names(user_id: str) -> list:
+    histories = exercise_history_collection.find({"user_id": user_id}, {"_id": 0, "exercise": 1}).sort("_id", 1)
+    return [history["exercise"] async for history in histories]
+
+
+async def get_dashboard(user_id: str) -> dict | None:
+    """Everything the dashboard page renders, fetched concurrently and cached per user."""
+    dashboard = dashboard_cache.get(user_id)
+    if dashboard:
+        return dashboard
+
+    now = datetime.now(timezone.utc)
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    profile, today, stats, exercises = await asyncio.gather(
+        get_user_profile(user_id),
+        _today_calories(user_id, day_start),
+        get_workout_stats(user_id),
+        _exercise_names(user_id)
+    )
+    if not profile:
+        return None
+
+    dashboard = {
+        "calories": {
+            "total_calories": today["total_calories"] if today else 0,
+            "calorie_goal": today["calorie_goal"] if today else await calorie_goal_for(user_id, profile)
+        },
+        "workouts": {
+            "template_count": stats["workout_count"],
+            "completed_count": stats["completed_count"],
+            "last_completed_at": stats.get("last_completed_at"),
+            "weekly_streak": weekly_streak(stats["active_weeks"], now)
+        },
+        "exercises": exercises
+    }
+    dashboard_cache.set(user_id, dashboard, expires_at=(day_start + timedelta(days=1)).timestamp())
+    return dashboard
@@ -1,16 +1,209 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 from dotenv import load_dotenv
+from services.metrics import command_metrics
+import logging
 import os
+import threading
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGO_URI = os.getenv("MONGO_URI")
-client = AsyncIOMotorClient(MONGO_URI)
-db = client["Hypertrio"]
-users_collection = db["Users"]
-sessions_collection = db["Sessions"]
-workouts_collection = db["Workouts"]
-macros_collection = db["Macros"]
-completed_workouts_collection = db["CompletedWorkouts"]
-calories_collection = db["Calories"]
+DATABASE_NAME = "Hypertrio"
+
+# Pool settings apply per process, i.e. per uvicorn worker. Unset values keep the driver defaults.
+POOL_SETTINGS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", int),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", int),
+    "readPreference": ("MONGO_READ_PREFERENCE", str),
+}
+DEFAULT_MAX_POOL_SIZE = 100
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks connection checkouts so pools can be sized against real load.
+
+    maxPoolSize applies to each server's pool, so checkouts are also counted per
+    server and saturation is reported per pool, with the fullest one at the top level.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.max_pool_size = DEFAULT_MAX_POOL_SIZE
+        self.open_connections = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checked_out_by_pool = {}
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _record_wait(self, event):
+        # Checkout events carry how long the checkout took, including waiting for a free connection
+        duration = getattr(event, "duration", None) or 0.0
+        self.total_wait_seconds += duration
+        self.max_wait_seconds = max(self.max_wait_seconds, duration)
+
+    def _adjust_pool(self, event, delta: int):
+        host, port = event.address
+        pool = f"{host}:{port}"
+        self.checked_out_by_pool[pool] = self.checked_out_by_pool.get(pool, 0) + delta
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            self._adjust_pool(event, 1)
+            self._record_wait(event)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self._record_wait(event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+            self._adjust_pool(event, -1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            host, port = event.address
+            self.checked_out_by_pool.pop(f"{host}:{port}", None)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def _saturation(self, checked_out: int) -> float:
+        return checked_out / self.max_pool_size if self.max_pool_size else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = {
+                pool: {"checked_out": checked_out, "saturation": self._saturation(checked_out)}
+                for pool, checked_out in self.checked_out_by_pool.items()
+            }
+            return {
+                "max_pool_size": self.max_pool_size,
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                # Of the fullest server pool
+                "saturation": max((pool["saturation"] for pool in pools.values()), default=0.0),
+                "pools": pools,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_checkout_wait_seconds": self.total_wait_seconds / self.checkouts if self.checkouts else 0.0,
+                "max_checkout_wait_seconds": self.max_wait_seconds,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def pool_settings() -> dict:
+    settings = {}
+    for option, (env_var, cast) in POOL_SETTINGS.items():
+        value = os.getenv(env_var)
+        if value:
+            settings[option] = cast(value)
+    return settings
+
+
+def create_client(uri: str | None = None) -> AsyncIOMotorClient:
+    """Build a Motor client configured from the MONGO_* environment variables."""
+    settings = pool_settings()
+    pool_metrics.max_pool_size = settings.get("maxPoolSize", DEFAULT_MAX_POOL_SIZE)
+    # Motor defers connecting until the first operation
+    return AsyncIOMotorClient(uri or MONGO_URI, event_listeners=[pool_metrics, command_metrics], **settings)
+
+
+_client: AsyncIOMotorClient | None = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    """The process's client: the one connect() created, or one created on first use by scripts."""
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+
+def get_database():
+    return get_client()[DATABASE_NAME]
+
+
+async def connect(uri: str | None = None) -> AsyncIOMotorClient:
+    """Create the client from the app's lifespan and fail fast if Mongo is unreachable."""
+    global _client
+    if _client is None:
+        _client = create_client(uri)
+    await _client.admin.command("ping")
+    logger.info(f"Connected to MongoDB with pool settings {pool_settings() or 'driver defaults'}")
+    return _client
+
+
+def close():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+class DeferredCollection:
+    """Collection handle that modules can import before the client exists.
+
+    Resolves against the current client on use, and re-resolves after a reconnect.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._client = None
+        self._collection = None
+
+    def __getattr__(self, attr):
+        client = get_client()
+        if self._client is not client:
+            self._client, self._collection = client, client[DATABASE_NAME][self.name]
+        return getattr(self._collection, attr)
+
 
+users_collection = DeferredCollection("Users")
+sessions_collection = DeferredCollection("Sessions")
+revoked_sessions_collection = DeferredCollection("RevokedSessions")
+workouts_collection = DeferredCollection("Workouts")
+macros_collection = DeferredCollection("Macros")
+completed_workouts_collection = DeferredCollection("CompletedWorkouts")
+calories_collection = DeferredCollection("Calories")
+exercise_history_collection = DeferredCollection("ExerciseHistory")
+user_stats_collection = DeferredCollection("UserStats")
+personal_records_collection = DeferredCollection("PersonalRecords")
+migrations_collection = DeferredCollection("Migrations")
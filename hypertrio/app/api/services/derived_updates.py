@@ -0,0 +1,122 @@
+from services.db import completed_workouts_collection
+from services.exercise_history import record_completed_workout
+from services.personal_records import record_personal_records
+from services.job_queue import JobQueue
+from services import workout_stats
+from services.dashboard import invalidate_dashboard
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+import logging
+import os
+import secrets
+import socket
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in derived_claimed_by
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+# How long a claim lasts. Applying a workout takes milliseconds; a claim that lapses
+# means its holder died mid-way, and the workout is recovered by another process.
+CLAIM_SECONDS = float(os.getenv("DERIVED_CLAIM_SECONDS", "60"))
+PENDING_FIELDS = {"derived_pending": "", "derived_claimed_by": "", "derived_claimed_until": ""}
+
+
+async def _record_stats(workout: dict):
+    await workout_stats.record_sessions(workout["user_id"], [workout])
+
+
+# Collections derived from each completed workout. A saved workout lists the steps it
+# still owes in derived_pending, and each is pulled once applied, so a restart resumes
+# from the first unfinished step. Every step is safe to repeat: history and stats skip
+# workouts they already hold, and records only ever move upwards.
+DERIVED_STEPS = {
+    "history": record_completed_workout,
+    "records": record_personal_records,
+    "stats": _record_stats,
+}
+
+
+def mark_pending(workout: dict) -> dict:
+    return {**workout, "derived_pending": list(DERIVED_STEPS)}
+
+
+def claim_fields() -> dict:
+    # Naive UTC, like the other expiry fields
+    return {"derived_claimed_by": WORKER_ID, "derived_claimed_until": datetime.utcnow() + timedelta(seconds=CLAIM_SECONDS)}
+
+
+def lapsed_claim(now: datetime) -> list:
+    """$or clauses matching workouts that no process holds a live claim on."""
+    return [{"derived_claimed_until": {"$exists": False}}, {"derived_claimed_until": {"$lt": now}}]
+
+
+async def claim(workout_id) -> dict | None:
+    """Claim a pending workout for this process; returns its outstanding steps, or None if
+    it is already applied or another process holds it."""
+    return await completed_workouts_collection.find_one_and_update(
+        {
+            "_id": workout_id,
+            "derived_pending": {"$exists": True},
+            "$or": lapsed_claim(datetime.utcnow())
+        },
+        {"$set": claim_fields()},
+        projection={"derived_pending": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def clear_pending(workout_ids: list):
+    await completed_workouts_collection.update_many({"_id": {"$in": workout_ids}}, {"$unset": PENDING_FIELDS})
+
+
+async def apply_derived_updates(workout: dict):
+    # Several processes may queue the same workout; only the one holding the claim applies it
+    claimed = await claim(workout["_id"])
+    if not claimed:
+        return
+    # A retry resumes at the step that failed
+    try:
+        for step in claimed["derived_pending"]:
+            await DERIVED_STEPS[step](workout)
+            await completed_workouts_collection.update_one({"_id": workout["_id"]}, {"$pull": {"derived_pending": step}})
+    except Exception:
+        # Release the claim so the retry, or another process, can pick the workout up
+        await completed_workouts_collection.update_one(
+            {"_id": workout["_id"], "derived_claimed_by": WORKER_ID},
+            {"$unset": {"derived_claimed_by": "", "derived_claimed_until": ""}}
+        )
+        raise
+    await clear_pending([workout["_id"]])
+    invalidate_dashboard(workout["user_id"])
+
+
+async def submit_derived_updates(workout: dict) -> bool:
+    """Queue the workout's derived updates; returns False when the queue is full.
+
+    The workout then stays derived_pending and the maintenance sweeper queues it on a later pass.
+    """
+    return await derived_queue.submit(f"derived updates for {workout['_id']}", apply_derived_updates, workout)
+
+
+async def recover_pending_workouts() -> int:
+    """Queue the derived updates of pending workouts that no live process is applying.
+
+    Covers workouts saved before the last shutdown and those whose applier died mid-way.
+    """
+    recovered = 0
+    query = {"derived_pending": {"$exists": True}, "$or": lapsed_claim(datetime.utcnow())}
+    async for workout in completed_workouts_collection.find(query).sort("_id", 1):
+        if not await submit_derived_updates(workout):
+            # The queue is full; the rest wait for the next pass
+            break
+        recovered += 1
+    if recovered:
+        logger.info(f"Recovered derived updates for {recovered} completed workouts")
+    return recovered
+
+
+derived_queue = JobQueue(
+    workers=int(os.getenv("DERIVED_QUEUE_WORKERS", "4")),
+    max_queue=int(os.getenv("DERIVED_QUEUE_SIZE", "1000")),
+    retries=int(os.getenv("DERIVED_QUEUE_RETRIES", "3"))
+)
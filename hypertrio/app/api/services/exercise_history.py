@@ -0,0 +1,163 @@
+from services.db import completed_workouts_collection, exercise_history_collection
+from services.sets import SET_COLUMNS, normalize_set, push_columns, to_columns, to_rows
+from services.workout_stats import parse_completed_at
+from services.applied import not_applied, push_applied
+from pymongo import UpdateOne
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of CompletedWorkouts documents replayed per bulk write during a rebuild
+REBUILD_BATCH_SIZE = 500
+# Sort key for completed_at values that do not parse
+EARLIEST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def history_updates(workout: dict) -> list:
+    """Build the ExerciseHistory upserts for a single completed workout.
+
+    Each (user_id, exercise) pair has one history document holding every set ever
+    logged for that exercise, in the order it was saved (completed_at order after
+    a rebuild), as parallel kg, reps, completed_at and notes arrays. applied_workouts
+    lists the workouts folded in most recently, so replaying one leaves the history unchanged.
+    """
+    user_id = workout["user_id"]
+    completed_at = workout.get("completed_at")
+    now = datetime.now()
+    updates = []
+    for exercise_name, sets in workout.get("exercises", {}).items():
+        key = {"user_id": user_id, "exercise": exercise_name}
+        # Attach the completed_at timestamp to each set; older workouts may still hold string kg/reps
+        sets_with_timestamp = [{**normalize_set(s), "completed_at": completed_at} for s in sets]
+        # Create the document first; the guarded update below cannot upsert without risking duplicates
+        updates.append(UpdateOne(key, {"$setOnInsert": {"created_at": now}}, upsert=True))
+        updates.append(UpdateOne(
+            {**key, **not_applied(workout["_id"])},
+            {
+                "$push": {**push_columns(sets_with_timestamp), **push_applied([workout["_id"]])},
+                "$set": {"updated_at": now}
+            }
+        ))
+    return updates
+
+
+async def record_completed_workout(workout: dict):
+    """Fold one completed workout into the user's exercise history."""
+    updates = history_updates(workout)
+    if updates:
+        await exercise_history_collection.bulk_write(updates, ordered=True)
+
+
+def completed_key(row: dict) -> datetime:
+    return parse_completed_at(row.get("completed_at")) or EARLIEST
+
+
+def merge_rows(stored: list, added: list) -> list:
+    """Interleave added set rows into the stored ones by completed_at, keeping the stored order."""
+    added = sorted(added, key=completed_key)
+    merged, i = [], 0
+    for row in stored:
+        while i < len(added) and completed_key(added[i]) < completed_key(row):
+            merged.append(added[i])
+            i += 1
+        merged.append(row)
+    return merged + added[i:]
+
+
+async def merge_exercise_sets(user_id: str, exercise_name: str, workouts: list):
+    """Merge the sets several completed workouts logged for one exercise into its history, by date.
+
+    The document is rewritten in place, guarded by its updated_at so a concurrent
+    append is never overwritten; on a conflict the merge is redone.
+    """
+    key = {"user_id": user_id, "exercise": exercise_name}
+    projection = {"_id": 0, "updated_at": 1, "applied_workouts": 1, **{column: 1 for column in SET_COLUMNS}}
+    while True:
+        now = datetime.now()
+        await exercise_history_collection.update_one(key, {"$setOnInsert": {"created_at": now}}, upsert=True)
+        history = await exercise_history_collection.find_one(key, projection)
+        applied = set(history.get("applied_workouts", []))
+        added = [workout for workout in workouts if workout["_id"] not in applied]
+        if not added:
+            return
+        rows = merge_rows(to_rows(history), [
+            {**normalize_set(s), "completed_at": workout["completed_at"]}
+            for workout in added for s in workout["exercises"][exercise_name]
+        ])
+        result = await exercise_history_collection.update_one(
+            {**key, "updated_at": history.get("updated_at")},
+            {"$set": {**to_columns(rows), "updated_at": now}, "$push": push_applied([w["_id"] for w in added])}
+        )
+        if result.modified_count:
+            return
+
+
+async def merge_completed_workouts(user_id: str, workouts: list):
+    """Fold a batch of one user's completed workouts into their histories in completed_at order.
+
+    Unlike record_completed_workout, which appends, this suits imports of older
+    sessions. Only the exercises the batch logged are touched.
+    """
+    by_exercise = {}
+    for workout in workouts:
+        for exercise_name in workout["exercises"]:
+            by_exercise.setdefault(exercise_name, []).append(workout)
+    for exercise_name, exercise_workouts in by_exercise.items():
+        await merge_exercise_sets(user_id, exercise_name, exercise_workouts)
+
+
+async def replay_order(user_id: str) -> list:
+    """_ids of the user's completed workouts, oldest completed_at first."""
+    workouts = [workout async for workout in
+                completed_workouts_collection.find({"user_id": user_id}, {"completed_at": 1})]
+    workouts.sort(key=lambda workout: (completed_key(workout), workout["_id"]))
+    return [workout["_id"] for workout in workouts]
+
+
+async def rebuild_user_history(user_id: str) -> int:
+    await exercise_history_collection.delete_many({"user_id": user_id})
+    replayed = 0
+    workout_ids = await replay_order(user_id)
+    for start in range(0, len(workout_ids), REBUILD_BATCH_SIZE):
+        chunk = workout_ids[start:start + REBUILD_BATCH_SIZE]
+        workouts = {workout["_id"]: workout async for workout in
+                    completed_workouts_collection.find({"_id": {"$in": chunk}})}
+        updates = [update for workout_id in chunk if workout_id in workouts
+                   for update in history_updates(workouts[workout_id])]
+        if updates:
+            await exercise_history_collection.bulk_write(updates, ordered=True)
+        replayed += len(workouts)
+    return replayed
+
+
+async def rebuild_exercise_history(user_id: str | None = None) -> int:
+    """Recreate ExerciseHistory from CompletedWorkouts.
+
+    Rebuilds a single user when ``user_id`` is given, otherwise every user.
+    Sets are replayed in completed_at order. Returns the number of completed workouts replayed.
+    """
+    if user_id:
+        user_ids = [user_id]
+    else:
+        await exercise_history_collection.delete_many({})
+        user_ids = await completed_workouts_collection.distinct("user_id")
+
+    # Workouts whose history step is still queued are included; the step then finds them applied
+    replayed = 0
+    for rebuilt_user in user_ids:
+        replayed += await rebuild_user_history(rebuilt_user)
+
+    logger.info(f"Rebuilt exercise history from {replayed} completed workouts")
+    return replayed
+
+
+if __name__ == "__main__":
+    # Backfill with: python -m services.exercise_history [--user-id <id>]
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild ExerciseHistory from CompletedWorkouts")
+    parser.add_argument("--user-id", help="Only rebuild this user's history")
+    args = parser.parse_args()
+    asyncio.run(rebuild_exercise_history(args.user_id))
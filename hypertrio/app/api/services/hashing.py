@@ -0,0 +1,102 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import os
+import threading
+import time
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full and the request should be shed."""
+
+
+# passlib's argon2 backend is imported on first use, in whichever thread or process hashes,
+# so workers that never see a login do not load it
+def _hash(password: str) -> str:
+    from passlib.hash import argon2
+    return argon2.hash(password)
+
+
+def _verify(password: str, stored_hash: str) -> bool:
+    from passlib.hash import argon2
+    return argon2.verify(password, stored_hash)
+
+
+class PasswordHasher:
+    """Runs argon2 hashing on a bounded worker pool instead of the event loop.
+
+    At most ``workers`` hashes run at once and at most ``max_queue`` more may
+    wait for a worker; beyond that calls fail fast with ``PasswordHasherBusy``.
+    argon2 releases the GIL, so threads are enough unless the process is
+    CPU-starved, in which case ``kind="process"`` moves hashing off-process.
+    """
+
+    def __init__(self, workers: int, max_queue: int, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hasher pool kind: {kind}")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordHasherBusy("Password hashing queue is full")
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.total_seconds += time.perf_counter() - started
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, stored_hash: str) -> bool:
+        return await self._run(_verify, password, stored_hash)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending": self.pending,
+                "queue_depth": max(0, self.pending - self.workers),
+                "peak_pending": self.peak_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                # Includes time spent queued for a worker
+                "avg_seconds": self.total_seconds / self.completed if self.completed else 0.0,
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "256")),
+    kind=os.getenv("PASSWORD_HASH_POOL", "thread")
+)
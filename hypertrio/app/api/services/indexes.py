@@ -0,0 +1,154 @@
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
+from bson import ObjectId
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Every index the API relies on, by collection. Startup creates whichever are missing.
+INDEXES = {
+    "Users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "Sessions": [
+        IndexModel([("sessionId", ASCENDING)], name="sessionId_unique", unique=True),
+        # Mongo deletes sessions once expiresAt has passed
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+    "RevokedSessions": [
+        # Revoked signed tokens only need remembering until they would have expired anyway
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+    "Workouts": [
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING)], name="user_id_name"),
+        # Keyset pagination order for get_workouts
+        IndexModel([("user_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], name="user_id_created_at_id"),
+    ],
+    "CompletedWorkouts": [
+        # Also returns a user's sessions in insertion order without a blocking sort
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id_id"),
+        # Only workouts whose derived updates are still outstanding carry the field
+        IndexModel([("derived_pending", ASCENDING)], name="derived_pending_sparse", sparse=True),
+    ],
+    "Calories": [
+        # One document per user per UTC day
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING)], name="user_id_date_unique", unique=True),
+    ],
+    "ExerciseHistory": [
+        IndexModel([("user_id", ASCENDING), ("exercise", ASCENDING)], name="user_id_exercise_unique", unique=True),
+    ],
+    "UserStats": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "PersonalRecords": [
+        IndexModel([("user_id", ASCENDING), ("exercise", ASCENDING)], name="user_id_exercise_unique", unique=True),
+    ],
+    "Macros": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+}
+
+# The filters the routes issue, by collection. Each must be answered by an index scan.
+QUERY_PATTERNS = [
+    ("Users", {"email": "lifter@example.com"}),
+    ("Sessions", {"sessionId": "0" * 64}),
+    ("Workouts", {"user_id": "user"}),
+    ("Workouts", {"user_id": "user", "name": "Push"}),
+    ("Workouts", {"user_id": "user", "$or": [
+        {"created_at": {"$gt": datetime(2025, 1, 1)}},
+        {"created_at": datetime(2025, 1, 1), "_id": {"$gt": ObjectId("000000000000000000000000")}}
+    ]}),
+    ("CompletedWorkouts", {"user_id": "user"}),
+    ("CompletedWorkouts", {"derived_pending": {"$exists": True}}),
+    ("Calories", {"user_id": "user", "date": datetime(2025, 1, 1)}),
+    ("Calories", {"user_id": "user", "date": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2025, 1, 2)}}),
+    ("ExerciseHistory", {"user_id": "user"}),
+    ("ExerciseHistory", {"user_id": "user", "exercise": "Bench Press"}),
+    ("UserStats", {"user_id": "user"}),
+    ("PersonalRecords", {"user_id": "user", "exercise": "Bench Press"}),
+    ("Macros", {"user_id": "user"}),
+]
+
+
+class IndexBuildError(Exception):
+    """Raised when a unique index cannot be built; the writes relying on it would not be safe."""
+
+
+async def dedupe_calorie_days(collection) -> int:
+    """Merge Calories documents sharing a (user_id, date) into the oldest one; returns how many were removed.
+
+    Days logged before the unique index existed may have been written twice by concurrent first logs.
+    """
+    removed = 0
+    duplicates = collection.aggregate([
+        {"$group": {"_id": {"user_id": "$user_id", "date": "$date"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    async for group in duplicates:
+        days = await collection.find({"_id": {"$in": group["ids"]}}).sort("_id", 1).to_list(None)
+        keep, extra = days[0], days[1:]
+        food = sorted((entry for day in days for entry in day.get("food", [])),
+                      key=lambda entry: (entry.get("timestamp") is not None, entry.get("timestamp") or 0))
+        await collection.update_one({"_id": keep["_id"]}, {"$set": {
+            "food": food,
+            "total_calories": sum(day.get("total_calories", 0) for day in days),
+        }})
+        result = await collection.delete_many({"_id": {"$in": [day["_id"] for day in extra]}})
+        removed += result.deleted_count
+    if removed:
+        logger.info(f"Merged {removed} duplicate Calories day documents")
+    return removed
+
+
+# One-off data fixes that must run before an index can be built, by index name
+INDEX_MIGRATIONS = {
+    ("Calories", "user_id_date_unique"): dedupe_calorie_days,
+}
+
+
+async def ensure_indexes(database) -> list:
+    """Create any registered index that does not exist yet; returns the names created.
+
+    Raises IndexBuildError when a unique index cannot be built.
+    """
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        collection = database[collection_name]
+        existing = await collection.index_information()
+        missing = [index for index in indexes if index.document["name"] not in existing]
+        if not missing:
+            continue
+        for index in missing:
+            migrate = INDEX_MIGRATIONS.get((collection_name, index.document["name"]))
+            if migrate:
+                await migrate(collection)
+        try:
+            created.extend(await collection.create_indexes(missing))
+        except Exception as e:
+            if any(index.document.get("unique") for index in missing):
+                # e.g. duplicate emails: the upserts and lookups relying on uniqueness would race
+                raise IndexBuildError(f"Error creating indexes on {collection_name}: {str(e)}") from e
+            logger.error(f"Error creating indexes on {collection_name}: {str(e)}")
+    if created:
+        logger.info(f"Created indexes: {', '.join(created)}")
+    return created
+
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def find_collection_scans(database) -> list:
+    """Explain every registered query pattern and return the ones planned as a COLLSCAN."""
+    uncovered = []
+    for collection_name, query in QUERY_PATTERNS:
+        explain = await database[collection_name].find(query).explain()
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            uncovered.append((collection_name, query))
+    return uncovered
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """Runs coroutine jobs on a fixed set of asyncio workers after the request has returned.
+
+    Holds at most ``max_queue`` waiting jobs. When it is full ``submit`` returns False
+    without running the job, so callers must be able to redo it later; it never
+    moves the work into the caller's latency. When the workers are not running
+    (before startup, after shutdown, in tests) the job runs inline instead. Failed
+    jobs are retried ``retries`` times with exponential backoff before being counted as failed.
+    """
+
+    def __init__(self, workers: int, max_queue: int, retries: int = 3, backoff: float = 0.1):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retries = retries
+        self.backoff = backoff
+        self._queue: asyncio.Queue | None = None
+        self._tasks = []
+        self.running = False
+        self.in_flight = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.inline = 0
+        self.rejected = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.running = True
+
+    async def submit(self, name: str, fn, *args) -> bool:
+        """Queue the job; returns False, without running it, when the queue is full."""
+        if self.running:
+            try:
+                self._queue.put_nowait((name, fn, args, time.monotonic()))
+                return True
+            except asyncio.QueueFull:
+                self.rejected += 1
+                return False
+        self.inline += 1
+        await self._run(name, fn, args)
+        return True
+
+    async def _run(self, name: str, fn, args) -> bool:
+        for attempt in range(self.retries + 1):
+            try:
+                await fn(*args)
+                self.processed += 1
+                return True
+            except Exception as e:
+                if attempt == self.retries:
+                    self.failed += 1
+                    logger.error(f"Job {name} failed after {attempt + 1} attempts: {str(e)}")
+                    return False
+                self.retried += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _worker(self):
+        while True:
+            name, fn, args, enqueued_at = await self._queue.get()
+            self.last_lag = time.monotonic() - enqueued_at
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self.in_flight += 1
+            try:
+                await self._run(name, fn, args)
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        """Stop accepting jobs and wait for the queued ones; returns False if the timeout cut it short."""
+        if not self.running:
+            return True
+        self.running = False
+        drained = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            drained = False
+            logger.error(f"Job queue drain timed out with {self._queue.qsize()} jobs waiting")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        return drained
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "inline": self.inline,
+            "rejected": self.rejected,
+            # Seconds the most recent job waited for a worker
+            "lag_seconds": self.last_lag,
+            "max_lag_seconds": self.max_lag,
+        }
@@ -0,0 +1,114 @@
+from services.db import sessions_collection, revoked_sessions_collection
+from services.session_tokens import revoked_sessions
+from services.derived_updates import recover_pending_workouts
+from datetime import datetime
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds between maintenance passes
+SWEEP_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "300"))
+# Documents deleted per batch, the pause between batches, and the most batches one pass may run,
+# so a large backlog is worked off over several passes instead of saturating Mongo
+SWEEP_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
+SWEEP_BATCH_PAUSE = float(os.getenv("MAINTENANCE_BATCH_PAUSE_SECONDS", "0.05"))
+SWEEP_MAX_BATCHES = int(os.getenv("MAINTENANCE_MAX_BATCHES", "100"))
+
+
+async def purge_expired(collection, now: datetime, batch_size: int, pause: float, max_batches: int) -> int:
+    """Delete documents whose expiresAt has passed, a bounded batch at a time; returns how many were deleted."""
+    removed = 0
+    for _ in range(max_batches):
+        ids = [document["_id"] async for document in
+               collection.find({"expiresAt": {"$lt": now}}, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            break
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        removed += result.deleted_count
+        if len(ids) < batch_size:
+            break
+        await asyncio.sleep(pause)
+    return removed
+
+
+class Sweeper:
+    """Periodically removes expired session data, compacts in-process caches and
+    re-queues completed workouts whose derived updates were abandoned.
+
+    Mongo's TTL indexes also expire these documents, but only once a minute and only
+    where the index could be built; the sweeper keeps the collections bounded either way.
+    """
+
+    def __init__(self, caches: dict, interval: float = SWEEP_INTERVAL, batch_size: int = SWEEP_BATCH_SIZE,
+                 pause: float = SWEEP_BATCH_PAUSE, max_batches: int = SWEEP_MAX_BATCHES):
+        self.caches = caches
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_batches = max_batches
+        self._task: asyncio.Task | None = None
+        self.passes = 0
+        self.failures = 0
+        self.removed = {}
+        self.last_pass = None
+
+    async def run_once(self) -> dict:
+        started = time.perf_counter()
+        # Expiry fields are stored as naive UTC
+        now = datetime.utcnow()
+        removed = {
+            "sessions": await purge_expired(sessions_collection, now, self.batch_size, self.pause, self.max_batches),
+            "revoked_sessions": await purge_expired(
+                revoked_sessions_collection, now, self.batch_size, self.pause, self.max_batches
+            ),
+        }
+        for name, cache in self.caches.items():
+            removed[f"{name}_cache"] = cache.purge_expired()
+        # Pick up logouts from other workers even when no signed session has been validated lately
+        await revoked_sessions.refresh()
+        # Workouts whose applier died mid-way are only claimable once its claim lapses
+        recovered = await recover_pending_workouts()
+
+        self.passes += 1
+        for key, count in removed.items():
+            self.removed[key] = self.removed.get(key, 0) + count
+        self.last_pass = {
+            "removed": removed,
+            "recovered_workouts": recovered,
+            "seconds": time.perf_counter() - started,
+            "finished_at": datetime.utcnow()
+        }
+        logger.info(f"Maintenance pass removed {removed} in {self.last_pass['seconds']:.3f}s")
+        return self.last_pass
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Maintenance pass failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "interval": self.interval,
+            "passes": self.passes,
+            "failures": self.failures,
+            "removed": self.removed,
+            "last_pass": self.last_pass,
+        }
@@ -0,0 +1,191 @@
+from contextvars import ContextVar
+from pymongo import monitoring
+import threading
+import time
+
+# Upper bounds, in seconds, of the request latency and per-request DB time buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the Mongo round trips per request buckets
+COMMAND_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative Prometheus histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help: str, label_names: tuple, buckets: tuple):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # One counter per bucket, then the sum and the count
+                series = self._series[labels] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                buckets = zip(self.buckets + ("+Inf",), series[:-2] + series[-1:])
+                for bound, count in buckets:
+                    le = 'le="' + str(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class RequestMetrics:
+    """DB work done on behalf of the current request."""
+
+    def __init__(self):
+        self.commands = 0
+        self.db_seconds = 0.0
+
+
+# Motor copies the caller's context into its executor threads, so command events see the request
+current_request: ContextVar[RequestMetrics | None] = ContextVar("current_request", default=None)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Counts Mongo commands and their time, overall and for the request that issued them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands = {}
+
+    def _record(self, event, failed: bool):
+        seconds = event.duration_micros / 1e6
+        with self._lock:
+            totals = self.commands.setdefault(event.command_name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += failed
+            request = current_request.get()
+            if request is not None:
+                request.commands += 1
+                request.db_seconds += seconds
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+    def render(self) -> list:
+        with self._lock:
+            commands = sorted(self.commands.items())
+        lines = []
+        for metric, kind, help, index in (
+            ("mongo_commands_total", "counter", "Mongo commands sent, by command name.", 0),
+            ("mongo_command_seconds_total", "counter", "Time spent in Mongo commands, by command name.", 1),
+            ("mongo_command_failures_total", "counter", "Mongo commands that failed, by command name.", 2),
+        ):
+            lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+            lines += [f'{metric}{{command="{_escape(name)}"}} {totals[index]}' for name, totals in commands]
+        return lines
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "Request latency by route template.",
+    ("method", "route", "status"), LATENCY_BUCKETS
+)
+request_db_seconds = Histogram(
+    "http_request_db_seconds", "Time spent in Mongo commands per request.",
+    ("method", "route"), LATENCY_BUCKETS
+)
+request_db_commands = Histogram(
+    "http_request_db_commands", "Mongo round trips per request.",
+    ("method", "route"), COMMAND_BUCKETS
+)
+command_metrics = CommandMetrics()
+
+
+def route_template(scope) -> str:
+    """The matched route's path with its router prefix, e.g. /workouts/stats/{user_id}.
+
+    Requests that matched no route share the "unmatched" label, so labels are bounded by
+    the app's routes and the raw request path is never used as a label.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    template = route.path.rstrip("/")
+    if ":path}" in template:
+        # A path parameter spans a variable number of segments, so the prefix can't be counted off
+        return template
+    # Included routers may report their route without the prefix. The segments in front of the
+    # template are that static prefix; every segment holding a parameter comes from the template
+    segments = scope["path"].rstrip("/").split("/")
+    prefix = segments[:len(segments) - template.count("/")]
+    return "/".join(prefix) + template or "/"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request, including any streamed body, and its DB work."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        request = RequestMetrics()
+        token = current_request.set(request)
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            # Labelled by template, so path parameters do not become separate series
+            route = route_template(scope)
+            method = scope["method"]
+            request_latency.observe((method, route, str(status)), elapsed)
+            request_db_seconds.observe((method, route), request.db_seconds)
+            request_db_commands.observe((method, route), request.commands)
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in (request_latency, request_db_seconds, request_db_commands):
+        lines += histogram.render()
+    lines += command_metrics.render()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,152 @@
+from services.db import macros_collection, users_collection
+from services.cache import TTLCache
+from services.profiles import invalidate_user_profile
+from bson import ObjectId
+from datetime import datetime
+import hashlib
+import json
+import os
+
+# Multipliers applied to BMR, matching the options of the macro calculator
+ACTIVITY_LEVELS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "light_plus": 1.465,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9,
+    "extra_active": 2.0,
+}
+# Daily calories added to TDEE for each goal
+GOAL_ADJUSTMENTS = {"maintain": 0, "lose": -500, "gain": 500}
+PROTEIN_G_PER_KG = 2.2
+FAT_CALORIE_SHARE = 0.25
+# Harris-Benedict (revised) BMR coefficients: constant, per kg, per cm, per year of age
+BMR_COEFFICIENTS = {
+    "male": (88.362, 13.397, 4.799, 5.677),
+    "female": (447.593, 9.247, 3.098, 4.330),
+}
+DEFAULT_CALORIE_GOAL = 2000
+# Inputs that determine a user's targets, in compute_macros argument order
+PROFILE_FIELDS = ("weight_kg", "height_cm", "age", "sex", "activity", "goal")
+
+# Computed targets by profile hash; identical inputs are only evaluated once per process
+macro_cache = TTLCache(
+    maxsize=int(os.getenv("MACRO_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("MACRO_CACHE_TTL", "3600"))
+)
+# Each user's stored Macros target ({} when none is stored), read on every calorie log.
+# save_user_macros refreshes the entry on write.
+target_cache = TTLCache(
+    maxsize=int(os.getenv("MACRO_TARGET_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("MACRO_TARGET_CACHE_TTL", "300"))
+)
+
+
+def _round(values):
+    import numpy as np
+    # Halves round up, like Math.round in the calculators, rather than to even
+    return np.floor(values + 0.5).astype(int)
+
+
+def compute_macros(weight_kg, height_cm, age, sex, activity, goal) -> dict:
+    """TDEE and macro split in grams for arrays of inputs, broadcast against each other.
+
+    ``sex``, ``activity`` and ``goal`` take the names used by BMR_COEFFICIENTS,
+    ACTIVITY_LEVELS and GOAL_ADJUSTMENTS. Returns arrays keyed by tdee, protein, carbs and fat.
+    """
+    # Imported on first use; the calorie and dashboard paths that load this module never need it
+    import numpy as np
+    weight_kg, height_cm, age = (np.asarray(value, dtype=float) for value in (weight_kg, height_cm, age))
+    male = np.asarray(sex) == "male"
+    coefficients = {
+        name: np.where(male, BMR_COEFFICIENTS["male"][i], BMR_COEFFICIENTS["female"][i])
+        for i, name in enumerate(("constant", "weight", "height", "age"))
+    }
+    bmr = (coefficients["constant"] + coefficients["weight"] * weight_kg
+           + coefficients["height"] * height_cm - coefficients["age"] * age)
+    multipliers = np.vectorize(ACTIVITY_LEVELS.__getitem__, otypes=[float])(activity)
+    adjustments = np.vectorize(GOAL_ADJUSTMENTS.__getitem__, otypes=[int])(goal)
+
+    tdee = _round(bmr * multipliers) + adjustments
+    protein = _round(weight_kg * PROTEIN_G_PER_KG)
+    fat = _round(tdee * FAT_CALORIE_SHARE / 9)
+    carbs = _round((tdee - (protein * 4 + fat * 9)) / 4)
+    tdee, protein, fat, carbs = np.broadcast_arrays(tdee, protein, fat, carbs)
+    return {"tdee": tdee, "protein": protein, "carbs": carbs, "fat": fat}
+
+
+def evaluate_scenarios(profiles: list, activities: list | None = None, goals: list | None = None) -> list:
+    """Targets for every profile under every activity level and goal, in one vectorized pass.
+
+    Without ``activities`` or ``goals`` each profile keeps its own.
+    """
+    activities = activities or [None]
+    goals = goals or [None]
+    rows = [
+        {**profile, "activity": activity or profile["activity"], "goal": goal or profile["goal"]}
+        for profile in profiles for activity in activities for goal in goals
+    ]
+    if not rows:
+        return []
+    results = compute_macros(*([row[field] for row in rows] for field in PROFILE_FIELDS))
+    return [
+        {**row, **{name: int(values[i]) for name, values in results.items()}}
+        for i, row in enumerate(rows)
+    ]
+
+
+def profile_hash(profile: dict) -> str:
+    canonical = json.dumps({field: profile[field] for field in PROFILE_FIELDS}, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def macros_for(profile: dict) -> dict:
+    key = profile_hash(profile)
+    targets = macro_cache.get(key)
+    if targets:
+        return targets
+    results = compute_macros(*(profile[field] for field in PROFILE_FIELDS))
+    targets = {"profile_hash": key, **{name: int(values) for name, values in results.items()}}
+    macro_cache.set(key, targets)
+    return targets
+
+
+async def save_user_macros(user_id: str, profile: dict) -> dict:
+    """Compute the user's targets and store them in Macros; unchanged profiles are not rewritten.
+
+    The TDEE also becomes the user's calorie_goal, so whichever of this and a
+    calorie_goal update through update_user happened last is the one in effect.
+    """
+    stored = await get_user_macros(user_id)
+    targets = macros_for(profile)
+    if stored and stored["profile_hash"] == targets["profile_hash"]:
+        document = stored
+    else:
+        document = {"user_id": user_id, "profile": profile, **targets, "updated_at": datetime.now()}
+        await macros_collection.update_one({"user_id": user_id}, {"$set": document}, upsert=True)
+        target_cache.set(user_id, document)
+    await users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": {"calorie_goal": document["tdee"]}})
+    invalidate_user_profile(user_id)
+    return document
+
+
+async def get_user_macros(user_id: str) -> dict | None:
+    target = target_cache.get(user_id)
+    if target is None:
+        target = await macros_collection.find_one({"user_id": user_id}, {"_id": 0}) or {}
+        target_cache.set(user_id, target)
+    return target or None
+
+
+async def calorie_goal_for(user_id: str, profile: dict) -> int:
+    """The profile's calorie_goal, which saving macros also sets.
+
+    Targets saved before save_user_macros wrote the goal onto the user fall back to the stored TDEE.
+    """
+    if "calorie_goal" in profile:
+        return profile["calorie_goal"]
+    target = await get_user_macros(user_id)
+    if target:
+        return target["tdee"]
+    return DEFAULT_CALORIE_GOAL
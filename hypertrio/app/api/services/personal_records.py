@@ -0,0 +1,138 @@
+from services.db import completed_workouts_collection, personal_records_collection
+from services.sets import normalize_set
+from pymongo import UpdateOne
+from datetime import datetime
+import argparse
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of CompletedWorkouts documents replayed per bulk write during a rebuild
+REBUILD_BATCH_SIZE = 500
+# Rep counts above this make both 1RM formulas unreliable
+MAX_ESTIMATE_REPS = 12
+# The rep-max table tracks the heaviest weight for every rep count up to this
+REP_MAX_TABLE_SIZE = 20
+
+
+def epley(kg: float, reps: int) -> float:
+    return kg if reps == 1 else kg * (1 + reps / 30)
+
+
+def brzycki(kg: float, reps: int) -> float:
+    return kg * 36 / (37 - reps)
+
+
+def best_records(sets: list) -> dict:
+    """Best set per record among ``sets`` (normalized and timestamped).
+
+    Maps each record's field path to (compared key, record). On a tie the earlier set wins.
+    """
+    records = {}
+
+    def consider(path: str, key: str, record: dict):
+        if path not in records or record[key] > records[path][1][key]:
+            records[path] = (key, record)
+
+    for s in sets:
+        kg, reps, completed_at = s.get("kg"), s.get("reps"), s.get("completed_at")
+        if kg is None or not reps or reps < 1:
+            continue
+        consider("heaviest", "kg", {"kg": kg, "reps": reps, "completed_at": completed_at})
+        consider("best_volume", "volume", {"volume": kg * reps, "kg": kg, "reps": reps, "completed_at": completed_at})
+        if reps <= MAX_ESTIMATE_REPS:
+            for formula in (epley, brzycki):
+                consider(f"e1rm.{formula.__name__}", "value",
+                         {"value": formula(kg, reps), "kg": kg, "reps": reps, "completed_at": completed_at})
+        if reps <= REP_MAX_TABLE_SIZE:
+            consider(f"rep_maxes.{reps}", "kg", {"kg": kg, "completed_at": completed_at})
+    return records
+
+
+def record_updates(user_id: str, exercise: str, sets: list) -> list:
+    """Conditional updates that raise each of the exercise's records the sets beat.
+
+    Every record is replaced by its own filtered update, so concurrent writers can
+    only ever move a record upwards.
+    """
+    records = best_records(sets)
+    if not records:
+        return []
+    key = {"user_id": user_id, "exercise": exercise}
+    now = datetime.now()
+    # Create the document first; the conditional updates below cannot upsert without risking duplicates
+    updates = [UpdateOne(key, {"$setOnInsert": {"created_at": now}}, upsert=True)]
+    for path, (compared, record) in records.items():
+        updates.append(UpdateOne(
+            {**key, "$or": [{f"{path}.{compared}": {"$lt": record[compared]}}, {path: {"$exists": False}}]},
+            {"$set": {path: record, "updated_at": now}}
+        ))
+    return updates
+
+
+async def append_personal_records(user_id: str, sets_by_exercise: dict):
+    """Fold timestamped sets for several of a user's exercises into their records in one bulk write."""
+    updates = []
+    for exercise_name, sets in sets_by_exercise.items():
+        updates.extend(record_updates(user_id, exercise_name, [normalize_set(s) for s in sets]))
+    if updates:
+        await personal_records_collection.bulk_write(updates, ordered=True)
+
+
+async def record_personal_records(workout: dict):
+    """Fold one completed workout into the user's personal records."""
+    completed_at = workout.get("completed_at")
+    await append_personal_records(workout["user_id"], {
+        exercise_name: [{**s, "completed_at": completed_at} for s in sets]
+        for exercise_name, sets in workout.get("exercises", {}).items()
+    })
+
+
+async def get_personal_records(user_id: str, exercise: str) -> dict | None:
+    return await personal_records_collection.find_one(
+        {"user_id": user_id, "exercise": exercise},
+        {"_id": 0, "user_id": 0}
+    )
+
+
+async def rebuild_personal_records(user_id: str | None = None) -> int:
+    """Recreate PersonalRecords from CompletedWorkouts.
+
+    Rebuilds a single user when ``user_id`` is given, otherwise every user.
+    Returns the number of completed workouts replayed.
+    """
+    query = {"user_id": user_id} if user_id else {}
+    await personal_records_collection.delete_many(query)
+
+    replayed = 0
+    updates = []
+    # Replay in insertion order so ties keep the set that was logged first
+    # Workouts whose records step is still queued are applied by the queue
+    cursor = completed_workouts_collection.find(
+        {**query, "derived_pending": {"$ne": "records"}}
+    ).sort("_id", 1).batch_size(REBUILD_BATCH_SIZE)
+    async for workout in cursor:
+        completed_at = workout.get("completed_at")
+        for exercise_name, sets in workout.get("exercises", {}).items():
+            updates.extend(record_updates(
+                workout["user_id"], exercise_name, [{**normalize_set(s), "completed_at": completed_at} for s in sets]
+            ))
+        replayed += 1
+        if replayed % REBUILD_BATCH_SIZE == 0 and updates:
+            await personal_records_collection.bulk_write(updates, ordered=True)
+            updates = []
+    if updates:
+        await personal_records_collection.bulk_write(updates, ordered=True)
+
+    logger.info(f"Rebuilt personal records from {replayed} completed workouts")
+    return replayed
+
+
+if __name__ == "__main__":
+    # Backfill with: python -m services.personal_records [--user-id <id>]
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild PersonalRecords from CompletedWorkouts")
+    parser.add_argument("--user-id", help="Only rebuild this user's records")
+    args = parser.parse_args()
+    asyncio.run(rebuild_personal_records(args.user_id))
@@ -0,0 +1,26 @@
+from services.db import users_collection
+from services.cache import TTLCache
+from bson import ObjectId
+import os
+
+# User documents (without the password hash) for hot paths that only need profile
+# fields such as calorie_goal. update_user invalidates entries on write.
+profile_cache = TTLCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", "300"))
+)
+
+
+async def get_user_profile(user_id: str) -> dict | None:
+    profile = profile_cache.get(user_id)
+    if profile:
+        return profile
+    profile = await users_collection.find_one({"_id": ObjectId(user_id)}, {"password": 0})
+    if profile:
+        profile["_id"] = str(profile["_id"])
+        profile_cache.set(user_id, profile)
+    return profile
+
+
+def invalidate_user_profile(user_id: str):
+    profile_cache.invalidate(user_id)
@@ -0,0 +1,154 @@
+from services.db import revoked_sessions_collection
+from services.cache import TTLCache
+from datetime import datetime, timezone
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+TOKEN_VERSION = "v1"
+
+
+class InvalidSessionToken(Exception):
+    """Raised when a signed session token is malformed, forged, signed with an unknown key or expired."""
+
+
+def _encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def is_signed_token(session_id: str) -> bool:
+    return session_id.startswith(f"{TOKEN_VERSION}.")
+
+
+def parse_signing_keys(value: str) -> dict:
+    """Parse "kid:secret,kid:secret" into {kid: secret bytes}, keeping the listed order."""
+    keys = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        kid, _, secret = entry.partition(":")
+        if not kid or not secret:
+            raise ValueError(f"Invalid session signing key entry: {kid or entry!r}")
+        keys[kid] = secret.encode()
+    return keys
+
+
+class SessionSigner:
+    """Issues and verifies HMAC-SHA256 signed session tokens.
+
+    A token is ``v1.<kid>.<claims>.<signature>``; the claims carry the user id, role,
+    expiry and a random token id used for revocation. Tokens are signed with the
+    ``active`` key and verified with whichever configured key their kid names, so a
+    new key can be rolled out first and the old one removed once its tokens expire.
+    """
+
+    def __init__(self, keys: dict, active: str | None = None, lifetime: float = 86400):
+        if not keys:
+            raise ValueError("At least one session signing key is required")
+        self.keys = keys
+        self.active = active or next(iter(keys))
+        if self.active not in keys:
+            raise ValueError(f"Unknown active session signing key: {self.active}")
+        self.lifetime = lifetime
+
+    def _signature(self, kid: str, claims: str) -> str:
+        return _encode(hmac.new(self.keys[kid], f"{TOKEN_VERSION}.{kid}.{claims}".encode(), hashlib.sha256).digest())
+
+    def issue(self, user_id: str, role: str = "user") -> str:
+        claims = _encode(json.dumps({
+            "sub": user_id,
+            "role": role,
+            "exp": int(time.time() + self.lifetime),
+            "jti": secrets.token_hex(16),
+        }, separators=(",", ":")).encode())
+        return f"{TOKEN_VERSION}.{self.active}.{claims}.{self._signature(self.active, claims)}"
+
+    def verify(self, token: str, check_expiry: bool = True) -> dict:
+        try:
+            version, kid, claims, signature = token.split(".")
+        except ValueError:
+            raise InvalidSessionToken("Invalid session")
+        if version != TOKEN_VERSION or kid not in self.keys:
+            raise InvalidSessionToken("Invalid session")
+        # Compared as bytes: compare_digest rejects str arguments holding non-ASCII characters
+        if not hmac.compare_digest(signature.encode(), self._signature(kid, claims).encode()):
+            raise InvalidSessionToken("Invalid session")
+        try:
+            payload = json.loads(_decode(claims))
+        except ValueError:
+            raise InvalidSessionToken("Invalid session")
+        if check_expiry and payload["exp"] < time.time():
+            raise InvalidSessionToken("Session expired")
+        return payload
+
+
+class RevocationList:
+    """Token ids of signed sessions that were logged out before they expired.
+
+    Lookups are answered from memory. Revocations are also written to Mongo, which drops
+    them at expiry, and each worker reloads that list at most every ``refresh_interval``
+    seconds; that interval bounds how long another worker's logout can go unnoticed.
+    """
+
+    def __init__(self, refresh_interval: float = 30):
+        self.refresh_interval = refresh_interval
+        self._revoked = {}
+        self._refreshed_at = float("-inf")
+
+    async def refresh(self):
+        now = time.time()
+        revoked = {}
+        async for entry in revoked_sessions_collection.find({"expiresAt": {"$gt": datetime.utcnow()}}):
+            revoked[entry["_id"]] = entry["expiresAt"].replace(tzinfo=timezone.utc).timestamp()
+        # Keep local revocations that another worker's reload may not include yet
+        revoked.update({jti: exp for jti, exp in self._revoked.items() if exp > now})
+        self._revoked = revoked
+        self._refreshed_at = time.monotonic()
+
+    async def is_revoked(self, jti: str) -> bool:
+        if time.monotonic() - self._refreshed_at > self.refresh_interval:
+            await self.refresh()
+        return jti in self._revoked
+
+    async def revoke(self, jti: str, expires_at: float):
+        self._revoked[jti] = expires_at
+        await revoked_sessions_collection.update_one(
+            {"_id": jti},
+            # Stored as naive UTC like Sessions.expiresAt, for the TTL index
+            {"$set": {"expiresAt": datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None)}},
+            upsert=True
+        )
+
+    def clear(self):
+        self._revoked = {}
+        self._refreshed_at = float("-inf")
+
+
+# "stored" keeps a Sessions document per login; "signed" issues self-contained tokens.
+# Either kind of session id is accepted for validation and logout whatever the mode.
+SESSION_MODE = os.getenv("SESSION_MODE", "stored")
+
+signing_keys = parse_signing_keys(os.getenv("SESSION_SIGNING_KEYS", ""))
+session_signer = SessionSigner(
+    signing_keys,
+    active=os.getenv("SESSION_SIGNING_KEY_ID") or None,
+    lifetime=float(os.getenv("SESSION_LIFETIME_SECONDS", "86400"))
+) if signing_keys else None
+if SESSION_MODE == "signed" and session_signer is None:
+    raise RuntimeError("SESSION_MODE=signed requires SESSION_SIGNING_KEYS")
+
+revoked_sessions = RevocationList(refresh_interval=float(os.getenv("SESSION_REVOCATION_REFRESH", "30")))
+
+# Validated sessions joined with their user, so repeat validations skip both Mongo lookups.
+# Entries never outlive the session's expiresAt; the TTL bounds how long another worker's
+# logout can go unnoticed by this one.
+session_cache = TTLCache(
+    maxsize=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SESSION_CACHE_TTL", "60"))
+)
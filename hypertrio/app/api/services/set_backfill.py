@@ -0,0 +1,77 @@
+from services.db import completed_workouts_collection, migrations_collection
+from services.exercise_history import rebuild_exercise_history
+from services.sets import is_normalized, normalize_set
+from pymongo import UpdateOne
+from datetime import datetime
+import argparse
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "numeric_sets"
+# CompletedWorkouts documents converted per bulk write; progress is checkpointed after each batch
+BACKFILL_BATCH_SIZE = 500
+
+
+def normalized_exercises(workout: dict) -> dict | None:
+    """The workout's exercises with numeric kg/reps, or None when it is already converted."""
+    exercises = workout.get("exercises", {})
+    if all(is_normalized(s) for sets in exercises.values() for s in sets):
+        return None
+    return {name: [normalize_set(s) for s in sets] for name, sets in exercises.items()}
+
+
+async def backfill_numeric_sets(batch_size: int = BACKFILL_BATCH_SIZE, restart: bool = False) -> int:
+    """Convert string kg/reps in CompletedWorkouts to numbers, then rebuild ExerciseHistory.
+
+    Walks CompletedWorkouts in _id order and records the last converted _id in the
+    Migrations collection, so an interrupted run resumes where it stopped.
+    Returns the number of workouts converted by this run.
+    """
+    if restart:
+        await migrations_collection.delete_one({"_id": MIGRATION_ID})
+    checkpoint = await migrations_collection.find_one({"_id": MIGRATION_ID}) or {}
+    if checkpoint.get("finished_at"):
+        logger.info("Numeric set backfill already finished")
+        return 0
+
+    last_id = checkpoint.get("last_id")
+    converted = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        batch = await completed_workouts_collection.find(query, {"exercises": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        updates = []
+        for workout in batch:
+            exercises = normalized_exercises(workout)
+            if exercises is not None:
+                updates.append(UpdateOne({"_id": workout["_id"]}, {"$set": {"exercises": exercises}}))
+        if updates:
+            await completed_workouts_collection.bulk_write(updates, ordered=False)
+        converted += len(updates)
+        last_id = batch[-1]["_id"]
+        await migrations_collection.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": last_id, "updated_at": datetime.now()}, "$inc": {"converted": len(updates)}},
+            upsert=True
+        )
+
+    # Histories written before the switch still hold row-shaped string sets
+    await rebuild_exercise_history()
+    await migrations_collection.update_one(
+        {"_id": MIGRATION_ID}, {"$set": {"finished_at": datetime.now()}}, upsert=True
+    )
+    logger.info(f"Converted {converted} completed workouts to numeric sets")
+    return converted
+
+
+if __name__ == "__main__":
+    # Run with: python -m services.set_backfill [--batch-size 500] [--restart]
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Convert string kg/reps in CompletedWorkouts to numbers")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint and start over")
+    args = parser.parse_args()
+    asyncio.run(backfill_numeric_sets(args.batch_size, args.restart))
@@ -0,0 +1,67 @@
+import math
+import re
+
+# Leading number of a kg/reps string, mirroring JavaScript's parseFloat/parseInt
+NUMBER_PREFIX = re.compile(r"^\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+
+# ExerciseHistory keeps one parallel array per field instead of an array of set objects
+SET_COLUMNS = ("kg", "reps", "completed_at", "notes")
+
+
+def parse_number(value) -> float | None:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if math.isnan(value) else float(value)
+    match = NUMBER_PREFIX.match(str(value))
+    return float(match.group(1)) if match else None
+
+
+def parse_reps(value) -> int | None:
+    number = parse_number(value)
+    # Truncated like parseInt
+    return None if number is None else int(number)
+
+
+def parse_input_number(value) -> float | None:
+    """parse_number for submitted sets: a blank input means no value, other text must start with a number."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    number = parse_number(value)
+    if number is None:
+        raise ValueError(f"{value!r} is not a number")
+    return number
+
+
+def parse_input_reps(value) -> int | None:
+    number = parse_input_number(value)
+    return None if number is None else int(number)
+
+
+def normalize_set(logged_set: dict) -> dict:
+    """Return the set with numeric kg and reps; stored text that is not a number becomes None."""
+    return {
+        **logged_set,
+        "kg": parse_number(logged_set.get("kg")),
+        "reps": parse_reps(logged_set.get("reps")),
+        "notes": logged_set.get("notes") or ""
+    }
+
+
+def is_normalized(logged_set: dict) -> bool:
+    return normalize_set(logged_set) == logged_set
+
+
+def to_columns(sets: list) -> dict:
+    """Turn timestamped set objects into parallel kg/reps/completed_at/notes arrays."""
+    return {column: [s.get(column) for s in sets] for column in SET_COLUMNS}
+
+
+def to_rows(columns: dict) -> list:
+    """Inverse of to_columns, for responses that list sets one object at a time."""
+    return [dict(zip(SET_COLUMNS, values)) for values in zip(*(columns.get(column, []) for column in SET_COLUMNS))]
+
+
+def push_columns(sets: list) -> dict:
+    """$push that appends sets to every column of an ExerciseHistory document at once."""
+    return {column: {"$each": values} for column, values in to_columns(sets).items()}
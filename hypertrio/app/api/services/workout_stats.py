@@ -0,0 +1,115 @@
+from services.db import workouts_collection, completed_workouts_collection, user_stats_collection
+from services.applied import not_applied, push_applied
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta, timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_completed_at(completed_at) -> datetime | None:
+    """completed_at is an ISO string from the client; returns it as an aware UTC datetime."""
+    if isinstance(completed_at, datetime):
+        timestamp = completed_at
+    else:
+        try:
+            timestamp = datetime.fromisoformat(str(completed_at).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def week_key(timestamp: datetime) -> str:
+    year, week, _ = timestamp.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def weekly_streak(active_weeks, today: datetime) -> int:
+    """Consecutive ISO weeks with a session, ending this week (or last week if none yet this week)."""
+    active = set(active_weeks)
+    week = today
+    if week_key(week) not in active:
+        week -= timedelta(weeks=1)
+    streak = 0
+    while week_key(week) in active:
+        streak += 1
+        week -= timedelta(weeks=1)
+    return streak
+
+
+async def adjust_template_count(user_id: str, delta: int):
+    # Upserts, so a change made before the first get_workout_stats backfill is kept;
+    # the backfill then only adds the templates these changes have not counted
+    await user_stats_collection.update_one({"user_id": user_id}, {"$inc": {"workout_count": delta}}, upsert=True)
+
+
+def session_update(user_id: str, workout: dict) -> UpdateOne:
+    """Counts one completed workout, unless applied_workouts shows it was counted already.
+
+    Documents not backfilled yet (no completed_count) are left alone; the backfill counts the workout.
+    """
+    update = {"$inc": {"completed_count": 1}, "$push": push_applied([workout["_id"]])}
+    timestamp = parse_completed_at(workout.get("completed_at"))
+    if timestamp:
+        update["$max"] = {"last_completed_at": timestamp}
+        update["$addToSet"] = {"active_weeks": week_key(timestamp)}
+    return UpdateOne({"user_id": user_id, "completed_count": {"$exists": True}, **not_applied(workout["_id"])}, update)
+
+
+async def record_sessions(user_id: str, workouts: list):
+    """Fold completed workouts into the stats in one bulk write; each is counted at most once."""
+    if workouts:
+        await user_stats_collection.bulk_write([session_update(user_id, workout) for workout in workouts], ordered=False)
+
+
+async def build_workout_stats(user_id: str) -> dict:
+    """Count a user's stats from the source collections."""
+    workout_count = await workouts_collection.count_documents({"user_id": user_id})
+    completed_count = 0
+    last_completed_at = None
+    active_weeks = set()
+    # Workouts still owing their stats update are counted when it is applied
+    query = {"user_id": user_id, "derived_pending": {"$ne": "stats"}}
+    async for workout in completed_workouts_collection.find(query, {"_id": 0, "completed_at": 1}):
+        completed_count += 1
+        timestamp = parse_completed_at(workout.get("completed_at"))
+        if timestamp:
+            active_weeks.add(week_key(timestamp))
+            last_completed_at = max(last_completed_at or timestamp, timestamp)
+    return {
+        "user_id": user_id,
+        "workout_count": workout_count,
+        "completed_count": completed_count,
+        "last_completed_at": last_completed_at,
+        "active_weeks": sorted(active_weeks),
+    }
+
+
+async def get_workout_stats(user_id: str) -> dict:
+    projection = {"_id": 0, "applied_workouts": 0}
+    stats = await user_stats_collection.find_one({"user_id": user_id}, projection)
+    if stats and "completed_count" in stats:
+        return stats
+    # First request for this user: backfill from the source collections. Template
+    # changes may already have been counted into workout_count, so only the rest is added.
+    counted_templates = (stats or {}).get("workout_count", 0)
+    stats = await build_workout_stats(user_id)
+    backfill = {key: value for key, value in stats.items() if key not in ("user_id", "workout_count")}
+    try:
+        await user_stats_collection.update_one(
+            {"user_id": user_id, "completed_count": {"$exists": False}},
+            {
+                # Unset fields are left out so later $max updates start from nothing
+                "$set": {key: value for key, value in backfill.items() if value is not None},
+                "$inc": {"workout_count": stats["workout_count"] - counted_templates}
+            },
+            upsert=True
+        )
+        logger.info(f"Backfilled workout stats for user: {user_id}")
+    except DuplicateKeyError:
+        # A concurrent request backfilled first
+        pass
+    return await user_stats_collection.find_one({"user_id": user_id}, projection)
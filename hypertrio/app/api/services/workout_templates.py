@@ -0,0 +1,27 @@
+from services.db import workouts_collection
+from services.cache import TTLCache
+from bson import ObjectId
+import os
+
+# Fields returned by the by-id fetch
+TEMPLATE_FIELDS = {"name": 1, "exercises": 1, "user_id": 1, "created_at": 1, "updated_at": 1}
+
+# Recently viewed workout templates by id. The workout routes invalidate entries on update and delete.
+template_cache = TTLCache(
+    maxsize=int(os.getenv("WORKOUT_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("WORKOUT_CACHE_TTL", "300"))
+)
+
+
+async def get_workout_template(workout_id: ObjectId) -> dict | None:
+    workout = template_cache.get(workout_id)
+    if workout:
+        return workout
+    workout = await workouts_collection.find_one({"_id": workout_id}, TEMPLATE_FIELDS)
+    if workout:
+        template_cache.set(workout_id, workout)
+    return workout
+
+
+def invalidate_workout_template(workout_id: ObjectId):
+    template_cache.invalidate(workout_id)
@@ -2,43 +2,53 @@
 
 import { CalorieTrackingCard, WorkoutProgressCard } from "@/app/ui/dash_cards";
 import OverloadGraph from "@/app/ui/area-graph";
+import { WorkoutStats } from "@/app/lib/utils";
 import { useSession } from "next-auth/react";
 import { useEffect, useState } from "react";
 
+interface DashboardData {
+    calories: { total_calories: number; calorie_goal: number };
+    workouts: WorkoutStats;
+    exercises: string[];
+}
+
 export default function Dashboard() {
     const { data: session } = useSession();
-    const [exerciseData, setExerciseData] = useState<Record<string, any[]> | undefined>(undefined);
+    const [dashboard, setDashboard] = useState<DashboardData | undefined>(undefined);
 
     useEffect(() => {
-        const fetchExercises = async () => {
+        // One request for everything the dashboard shows
+        const fetchDashboard = async () => {
             if (session?.user?.id) {
                 try {
-                    const response = await fetch(`http://localhost:8000/workouts/exercises/${session.user.id}`);
-                    if (!response.ok) throw new Error('Failed to fetch exercises');
+                    const response = await fetch(`http://localhost:8000/dashboard/${session.user.id}`);
+                    if (!response.ok) throw new Error('Failed to fetch dashboard');
                     const data = await response.json();
-                    setExerciseData(data);
+                    setDashboard(data);
                 } catch (error) {
-                    console.error('Error fetching exercises:', error);
+                    console.error('Error fetching dashboard:', error);
                 }
             }
         };
 
-        fetchExercises();
+        fetchDashboard();
+        // Refresh every minute
+        const interval = setInterval(fetchDashboard, 60000);
+        return () => clearInterval(interval);
     }, [session]);
-    console.log(exerciseData);
     return (
         <div className="flex flex-col w-screen h-full">
             <div className="flex flex-row items-center justify-center p-6 gap-10 h-[40%]">
                 <div className="w-1/2 h-full">
-                    <CalorieTrackingCard />
+                    <CalorieTrackingCard calories={dashboard?.calories} />
                 </div>
                 <div className="w-1/2 h-full">
-                    <WorkoutProgressCard />
+                    <WorkoutProgressCard stats={dashboard?.workouts} />
                 </div>
             </div>
             <div className="flex flex-row items-center justify-center p-6 h-[60%]">
-                <OverloadGraph exerciseData={exerciseData}/>
+                <OverloadGraph userId={session?.user?.id} exercises={dashboard?.exercises}/>
             </div>
         </div>
     );
-}
\ No newline at end of file
+}
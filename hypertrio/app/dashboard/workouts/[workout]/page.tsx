@@ -5,7 +5,7 @@ import Menu from "../../../ui/menu";
 import { useEffect, useState } from 'react';
 import { useSession } from 'next-auth/react';
 import { useToast } from '@/app/ui/use-toast';
-import { useParams, useRouter } from 'next/navigation';
+import { useParams, useRouter, useSearchParams } from 'next/navigation';
 
 interface Workout {
     _id: string;
@@ -27,6 +27,7 @@ export default function Page() {
     const params = useParams();
     const router = useRouter();
     const workoutName = decodeURIComponent(params.workout as string);
+    const linkedWorkoutId = useSearchParams().get('id');
     const [exercises, setExercises] = useState<string[]>([]);
     const [isLoading, setIsLoading] = useState(true);
     const [isModalOpen, setIsModalOpen] = useState(false);
@@ -42,7 +43,11 @@ export default function Page() {
                 throw new Error('No user session found');
             }
 
-            const response = await fetch(`http://localhost:8000/workouts/workouts/${userId}/${workoutName}`);
+            // Look up by id when known; direct links by name fall back to the name lookup
+            const id = workoutId || linkedWorkoutId;
+            const response = await fetch(id
+                ? `http://localhost:8000/workouts/workout/${id}`
+                : `http://localhost:8000/workouts/workouts/${userId}/${encodeURIComponent(workoutName)}`);
             if (!response.ok) {
                 throw new Error('Failed to fetch workout');
             }
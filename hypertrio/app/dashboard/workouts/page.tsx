@@ -36,11 +36,19 @@ export default function Workouts() {
                 throw new Error('No user session found');
             }
 
-            const response = await fetch(`http://localhost:8000/workouts/workouts/${userId}`);
-            if (!response.ok) {
-                throw new Error('Failed to fetch workouts');
-            }
-            const workoutsList: Workout[] = await response.json();
+            // Follow the pagination cursor until every page has been fetched
+            const workoutsList: Workout[] = [];
+            let cursor: string | null = null;
+            do {
+                const params = new URLSearchParams({ fields: 'name,exercises' });
+                if (cursor) params.set('cursor', cursor);
+                const response = await fetch(`http://localhost:8000/workouts/workouts/${userId}?${params}`);
+                if (!response.ok) {
+                    throw new Error('Failed to fetch workouts');
+                }
+                workoutsList.push(...await response.json());
+                cursor = response.headers.get('X-Next-Cursor');
+            } while (cursor);
             
             const workoutsMap: WorkoutData = {};
             const idsMap: WorkoutIds = {};
@@ -34,17 +34,9 @@ export const fetchWorkouts = async () => {
     return workoutnum;
 };
 
-export const fetchWorkoutCount = async (session: any) => {
-    const userId = session?.user?.id;
-    if (!userId) {
-        throw new Error('No user session found');
-    }
-
-    const response = await fetch(`http://localhost:8000/workouts/workouts_count/${userId}`);
-    if (!response.ok) {
-        throw new Error('Failed to fetch workout count');
-    }
-    const workoutnum = await response.json();
-    return workoutnum;
-};
-    
\ No newline at end of file
+export interface WorkoutStats {
+    template_count: number;
+    completed_count: number;
+    last_completed_at: string | null;
+    weekly_streak: number;
+}
@@ -2,7 +2,7 @@
 
 import { TrendingUp } from "lucide-react"
 import { CartesianGrid, XAxis, YAxis, ResponsiveContainer, LineChart, Line, Tooltip, Legend } from "recharts"
-import { useState, useMemo } from "react"
+import { useState, useEffect } from "react"
 
 import {
   Card,
@@ -33,86 +33,48 @@ const chartConfig = {
   },
 } satisfies ChartConfig
 
-interface Set {
-  kg: string;
-  reps: string;
-  notes: string;
-  completed_at: string;
+interface OverloadPoint {
+  session: number;
+  score: number;
+  standard: number;
+  weight: number;
+  reps: number;
+  completedAt: string;
 }
 
-interface ExerciseData {
-  [key: string]: Set[];
-}
-
-export default function AreaGraph({ exerciseData }: { exerciseData?: ExerciseData }) {
+export default function AreaGraph({ userId, exercises }: { userId?: string, exercises?: string[] }) {
   const [selectedExercise, setSelectedExercise] = useState('');
   const [selectedTrainingType, setSelectedTrainingType] = useState<"hypertrophy" | "strength">("hypertrophy");
-  const [exerciseSets, setExerciseSets] = useState<Set[]>([]);
+  const [chartData, setChartData] = useState<OverloadPoint[]>([]);
 
-  function calculateWeightMultiplier(startWeight: number, currentWeight: number): number {
-    const weightDiff = currentWeight - startWeight;
-    return 1 + (0.10 * Math.floor(weightDiff / 2)); // +10% per 2kg increase
-  }
-  
-  function getRepMultiplier(reps: number, type: "hypertrophy" | "strength"): number {
-    if (type === "hypertrophy") {
-      if (reps <= 2) return 0.7; // heavily penalized
-      if (reps === 3) return 0.8;
-      if (reps === 4) return 0.9;
-      if (reps === 5) return 0.95;
-      if (reps === 6) return 1.0;
-      if (reps === 7) return 1.06;
-      if (reps === 8) return 1.09;
-      if (reps >= 9) return 1.10 + ((reps - 8) * 0.005); // small diminishing returns after 8
-    } else if (type === "strength") {
-      if (reps === 1) return 0.9;  // lower reps slightly penalized
-      if (reps === 2) return 0.95;
-      if (reps === 3) return 1.0;
-      if (reps === 4) return 1.05;
-      if (reps === 5) return 1.08;
-      if (reps >= 6) return 1.08 + ((reps - 5) * 0.003); // very small diminishing returns after 5
-    }
-    return 1.0; // fallback if somehow invalid
-  }
-  
+  // Scores are computed and downsampled by the API, so only the plotted points are fetched
+  useEffect(() => {
+    const fetchOverload = async () => {
+      if (!userId || !selectedExercise) return;
+      try {
+        const params = new URLSearchParams({
+          exercise: selectedExercise,
+          training_type: selectedTrainingType,
+        });
+        const response = await fetch(`http://localhost:8000/analytics/overload/${userId}?${params}`);
+        if (!response.ok) throw new Error('Failed to fetch overload scores');
+        const data = await response.json();
+        setChartData(data.series);
+      } catch (error) {
+        console.error('Error fetching overload scores:', error);
+      }
+    };
 
-  const chartData = useMemo(() => {
-    if (!exerciseSets?.length) return [];
-    const startWeight = parseFloat(exerciseSets[0].kg);
-    
-    return exerciseSets.map((set, index) => {
-      const weightMultiplier = calculateWeightMultiplier(startWeight, parseFloat(set.kg));
-      const reps = parseInt(set.reps, 10) || 0;
-      const repMultiplier = getRepMultiplier(reps, selectedTrainingType);
-      const score = 100 * weightMultiplier * repMultiplier;
-      
-      const standardScore = 100 + (index * 15); // Starts at 100 and increases by 15 each session
-      return {
-        session: index + 1,
-        score,
-        standard: standardScore,
-        weight: parseFloat(set.kg),
-        reps: parseInt(set.reps, 10),
-        completedAt: set.completed_at
-      };
-    });
-  }, [exerciseSets, selectedTrainingType]);
+    fetchOverload();
+  }, [userId, selectedExercise, selectedTrainingType]);
 
   const handleExerciseChange = (e: React.ChangeEvent<HTMLSelectElement>) => {
-    const exerciseName = e.target.value;
-    setSelectedExercise(exerciseName);
-    
-    if (exerciseData && exerciseName) {
-      const sets = exerciseData[exerciseName];
-      setExerciseSets(sets);
-      console.log(chartData)
-    }
+    setSelectedExercise(e.target.value);
   };
 
   const handleTrainingTypeChange = (e: React.ChangeEvent<HTMLSelectElement>) => {
     const type = e.target.value as "hypertrophy" | "strength";
     setSelectedTrainingType(type);
-    console.log(chartData)
   };
 
   return (
@@ -132,7 +94,7 @@ export default function AreaGraph({ exerciseData }: { exerciseData?: ExerciseDat
               onChange={handleExerciseChange}
             >
               <option value="" disabled>Select an exercise</option>
-              {exerciseData && Object.keys(exerciseData).map((exerciseName) => (
+              {exercises && exercises.map((exerciseName) => (
                 <option key={exerciseName} value={exerciseName}>
                   {exerciseName}
                 </option>
@@ -4,10 +4,8 @@ import { Button } from "@/app/ui/button";
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "@/app/ui/card";
 import { Progress } from "@/app/ui/progress";
 import { Download, MessageCircle, Flame, Dumbbell } from "lucide-react";
-import { useRouter, usePathname } from "next/navigation";
-import { useSession } from "next-auth/react";
-import { useState, useEffect } from "react";
-import { fetchWorkoutCount } from "@/app/lib/utils";
+import { useRouter } from "next/navigation";
+import { WorkoutStats } from "@/app/lib/utils";
 
 
 interface DashCardProps {
@@ -73,29 +71,8 @@ export function MessageProgressCard() {
   );
 }
 
-export function CalorieTrackingCard() {
+export function CalorieTrackingCard({ calories }: { calories?: { total_calories: number; calorie_goal: number } }) {
   const router = useRouter();
-  const { data: session } = useSession();
-  const [todayCalories, setTodayCalories] = useState<{ total_calories: number; calorie_goal: number } | null>(null);
-
-  useEffect(() => {
-    const fetchTodayCalories = async () => {
-      try {
-        if (!session?.user?.id) return;
-        const response = await fetch(`http://localhost:8000/calories/today/${session.user.id}`);
-        if (!response.ok) throw new Error('Failed to fetch today\'s calories');
-        const data = await response.json();
-        setTodayCalories(data);
-      } catch (error) {
-        console.error('Error fetching today\'s calories:', error);
-      }
-    };
-
-    fetchTodayCalories();
-    // Refresh every minute
-    const interval = setInterval(fetchTodayCalories, 60000);
-    return () => clearInterval(interval);
-  }, [session]);
 
   const redirectCalories = () => {
     router.push('dashboard/calorie_log');
@@ -105,8 +82,8 @@ export function CalorieTrackingCard() {
     <DashCard
       title="Calorie Tracking"
       description="Daily calorie goal progress"
-      value={todayCalories?.total_calories || 0}
-      max={todayCalories?.calorie_goal || 2000}
+      value={calories?.total_calories || 0}
+      max={calories?.calorie_goal || 2000}
       icon={<Flame className="h-5 w-5 text-primary" />}
       buttonFunction={redirectCalories}
       buttonText="Log Calories"
@@ -114,24 +91,8 @@ export function CalorieTrackingCard() {
   );
 }
 
-export function WorkoutProgressCard() {
-  const [workoutCount, setWorkoutCount] = useState(0);
+export function WorkoutProgressCard({ stats }: { stats?: WorkoutStats }) {
   const router = useRouter();
-  const pathname = usePathname();
-  const { data: session } = useSession();
-
-  useEffect(() => {
-    if (pathname !== '/dashboard') return;
-    const getWorkoutCount = async () => {
-      try {
-        const count = await fetchWorkoutCount(session);
-        setWorkoutCount(count);
-      } catch (error) {
-        console.error('Error fetching workout count:', error);
-      }
-    };
-    getWorkoutCount();
-  }, [pathname, session]);
 
   const redirectWorkouts = () => {
     router.push('dashboard/workouts');
@@ -140,12 +101,12 @@ export function WorkoutProgressCard() {
   return (
     <DashCard
       title="Workout Progress"
-      description="Track your workout completion rate"
-      value={workoutCount}
+      description={`Track your workout completion rate · ${stats?.weekly_streak || 0} week streak`}
+      value={stats?.template_count || 0}
       max={7}
       icon={<Dumbbell className="h-5 w-5 text-primary" />}
       buttonFunction={redirectWorkouts}
       buttonText="Start Workout"
     />
   );
-}
\ No newline at end of file
+}
@@ -1,5 +1,6 @@
 'use client';
 import { useState } from 'react';
+import { useSession } from 'next-auth/react';
 
 type ActivityLevels = {
     [key: string]: number;
@@ -28,6 +29,19 @@ export default function MacroCalculator() {
     const [goal, setGoal] = useState<'maintain' | 'lose' | 'gain'>('maintain');
     const [result, setResult] = useState<MacroResult>(null);
 
+    const { data: session } = useSession();
+
+    // Activity level names used by the API's nutrition targets
+    const activityNames: Record<string, string> = {
+        m: 'sedentary',
+        l: 'light',
+        l1: 'light_plus',
+        l2: 'moderate',
+        g: 'active',
+        g1: 'very_active',
+        g2: 'extra_active'
+    };
+
     const activityLevels: ActivityLevels = {
         m: 1.2,    // Sedentary
         l: 1.375,  // Light
@@ -38,7 +52,39 @@ export default function MacroCalculator() {
         g2: 2.0    // Extra Active
     };
 
-    const calculateMacros = () => {
+    const saveMacros = async (): Promise<MacroResult> => {
+        // Signed-in users get their targets computed and stored server-side, so the calorie log picks them up
+        const userId = session?.user?.id;
+        if (!userId) return null;
+        try {
+            const response = await fetch(`http://localhost:8000/calories/macros/${userId}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    weight_kg: weight,
+                    height_cm: height,
+                    age,
+                    sex: gender,
+                    activity: activityNames[activityLevel],
+                    goal
+                })
+            });
+            if (!response.ok) return null;
+            const { tdee, protein, carbs, fat } = await response.json();
+            return { tdee, protein, carbs, fat };
+        } catch (error) {
+            console.error('Error saving macros:', error);
+            return null;
+        }
+    };
+
+    const calculateMacros = async () => {
+        const saved = await saveMacros();
+        if (saved) {
+            setResult(saved);
+            return;
+        }
+
         let bmr = 0;
         if (gender === 'male') {
             bmr = 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age);
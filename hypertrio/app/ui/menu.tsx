@@ -18,7 +18,9 @@ export default function WorkoutMenu({ workouts = {}, workoutIds = {}, exercises
 
   const handleItemClick = (item: string) => {
     if (mode === 'workouts') {
-      router.push(`workouts/${encodeURIComponent(item)}`);
+      // Pass the id along so the workout page can fetch by primary key
+      const id = workoutIds[item];
+      router.push(`workouts/${encodeURIComponent(item)}${id ? `?id=${id}` : ''}`);
     }
   };
   
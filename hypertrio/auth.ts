@@ -114,6 +114,18 @@ export const {
       return session;
     },
   },
+  events: {
+    // End the FastAPI session so it stops validating (and is dropped from its cache)
+    async signOut(message) {
+      const sessionId = "token" in message ? message.token?.sessionId : undefined;
+      if (!sessionId) return;
+      try {
+        await fetch(`http://localhost:8000/auth/session/${sessionId}`, { method: "DELETE" });
+      } catch (error) {
+        console.error("Logout error:", error);
+      }
+    },
+  },
   pages: {
     signIn: '/login',
     error: '/login', // Redirect to login page on error
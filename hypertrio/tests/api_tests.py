@@ -0,0 +1,1175 @@
+import unittest
+import asyncio
+import importlib
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+from mongomock_motor import AsyncMongoMockClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from httpx import AsyncClient, ASGITransport
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+
+# The API is run from app/api (``uvicorn main:app``), so its modules import as top-level packages
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "api"))
+
+import main
+import lazy_routes
+import responses
+from services import db, applied, exercise_history, indexes, profiles, workout_stats, dashboard, set_backfill, personal_records, derived_updates, metrics, session_tokens, maintenance, workout_templates, nutrition
+from services.job_queue import JobQueue
+from services.hashing import password_hasher
+from routes import auth, workouts, calories, analytics, export, imports
+
+PATCHED_MODULES = [db, exercise_history, set_backfill, personal_records, derived_updates, session_tokens, maintenance, workout_templates, nutrition, profiles, workout_stats, dashboard, auth, workouts, calories, analytics, export, imports]
+
+
+class ApiTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs the FastAPI app in-process against an in-memory Motor stand-in.
+    Every test gets a fresh database.
+    """
+
+    def create_database(self):
+        return AsyncMongoMockClient()["Hypertrio"]
+
+    async def asyncSetUp(self):
+        self.db = self.create_database()
+        self._originals = []
+        # Swap every collection handle the routes imported for its in-memory equivalent
+        for module in PATCHED_MODULES:
+            for attr, value in list(vars(module).items()):
+                if attr.endswith("_collection"):
+                    self._originals.append((module, attr, value))
+                    setattr(module, attr, self.db[value.name])
+        auth.session_cache.clear()
+        profiles.profile_cache.clear()
+        dashboard.dashboard_cache.clear()
+        workout_templates.template_cache.clear()
+        nutrition.macro_cache.clear()
+        nutrition.target_cache.clear()
+        self.client = AsyncClient(transport=ASGITransport(app=main.app), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        for module, attr, value in self._originals:
+            setattr(module, attr, value)
+
+    async def login(self, email="lifter@example.com", password="password123", name="Lifter"):
+        await self.client.post("/auth/register", json={"name": name, "email": email, "password": password})
+        response = await self.client.post("/auth/login", json={"email": email, "password": password})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def complete_workout(self, user_id, exercises, completed_at="2025-05-01T10:00:00.000Z"):
+        response = await self.client.post("/workouts/completed", json={
+            "user_id": user_id,
+            "workout_name": "Push",
+            "exercises": exercises,
+            "completed_at": completed_at
+        })
+        self.assertEqual(response.status_code, 200)
+
+
+class ExerciseHistoryTests(ApiTestCase):
+    """Tests for the materialized ExerciseHistory collection."""
+
+    async def test_history_is_updated_incrementally(self):
+        await self.complete_workout("user1", {
+            "Bench Press": [{"kg": "60", "reps": "8", "notes": ""}],
+            "Dips": []
+        }, completed_at="2025-05-01T10:00:00.000Z")
+        await self.complete_workout("user1", {
+            "Bench Press": [{"kg": "62.5", "reps": "6", "notes": "hard"}]
+        }, completed_at="2025-05-03T10:00:00.000Z")
+
+        response = await self.client.get("/workouts/exercises/user1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "Bench Press": [
+                {"kg": 60, "reps": 8, "completed_at": "2025-05-01T10:00:00.000Z", "notes": ""},
+                {"kg": 62.5, "reps": 6, "completed_at": "2025-05-03T10:00:00.000Z", "notes": "hard"}
+            ],
+            "Dips": []
+        })
+
+    async def test_rebuild_matches_incremental_history(self):
+        await self.complete_workout("user1", {"Squat": [{"kg": "100", "reps": "5", "notes": ""}]})
+        await self.complete_workout("user2", {"Squat": [{"kg": "80", "reps": "5", "notes": ""}]})
+        await self.complete_workout("user1", {"Squat": [{"kg": "105", "reps": "5", "notes": ""}]})
+        expected = (await self.client.get("/workouts/exercises/user1")).json()
+
+        replayed = await exercise_history.rebuild_exercise_history("user1")
+        self.assertEqual(replayed, 2)
+        self.assertEqual((await self.client.get("/workouts/exercises/user1")).json(), expected)
+        self.assertEqual(len((await self.client.get("/workouts/exercises/user2")).json()["Squat"]), 1)
+
+
+class OverloadAnalyticsTests(ApiTestCase):
+    """Tests for the server-side progressive overload scores."""
+
+    async def test_scores_match_chart_formula(self):
+        await self.complete_workout("user1", {"Bench Press": [
+            {"kg": "60", "reps": "8", "notes": ""},
+            {"kg": "64kg", "reps": "3", "notes": ""},
+            {"kg": "", "reps": "5", "notes": "skipped"}
+        ]})
+
+        response = await self.client.get("/analytics/overload/user1", params={
+            "exercise": "Bench Press", "training_type": "strength"
+        })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["total_sets"], 3)
+        series = body["series"]
+        self.assertEqual([point["session"] for point in series], [1, 2])
+        self.assertAlmostEqual(series[0]["score"], 100 * 1.0 * (1.08 + 3 * 0.003))
+        self.assertAlmostEqual(series[1]["score"], 100 * 1.2 * 1.0)
+        self.assertEqual([point["standard"] for point in series], [100, 115])
+
+    async def test_series_is_downsampled(self):
+        sets = [{"kg": str(40 + 2 * i), "reps": "8", "notes": ""} for i in range(1000)]
+        await self.complete_workout("user1", {"Squat": sets})
+
+        response = await self.client.get("/analytics/overload/user1", params={"exercise": "Squat", "points": 50})
+        series = response.json()["series"]
+        self.assertEqual(len(series), 50)
+        sessions = [point["session"] for point in series]
+        self.assertEqual(sessions, sorted(sessions))
+        self.assertEqual(sessions[-1], 1000)
+
+        names = await self.client.get("/analytics/exercises/user1")
+        self.assertEqual(names.json(), ["Squat"])
+
+
+class SessionCacheTests(ApiTestCase):
+    """Tests for the in-process session validation cache."""
+
+    async def test_repeat_validations_are_served_from_cache(self):
+        user = await self.login()
+        before = (await self.client.get("/auth/session_cache")).json()
+        for _ in range(3):
+            response = await self.client.get(f"/auth/session/{user['sessionId']}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["email"], "lifter@example.com")
+
+        stats = (await self.client.get("/auth/session_cache")).json()
+        self.assertEqual(stats["hits"] - before["hits"], 2)
+        self.assertEqual(stats["misses"] - before["misses"], 1)
+
+    async def test_update_user_invalidates_cached_sessions(self):
+        user = await self.login()
+        await self.client.get(f"/auth/session/{user['sessionId']}")
+        await self.client.put(f"/auth/user/{user['_id']}", json={"name": "Renamed"})
+
+        response = await self.client.get(f"/auth/session/{user['sessionId']}")
+        self.assertEqual(response.json()["name"], "Renamed")
+
+    async def test_logout_invalidates_cached_session(self):
+        user = await self.login()
+        await self.client.get(f"/auth/session/{user['sessionId']}")
+
+        response = await self.client.delete(f"/auth/session/{user['sessionId']}")
+        self.assertEqual(response.status_code, 200)
+        response = await self.client.get(f"/auth/session/{user['sessionId']}")
+        self.assertEqual(response.status_code, 401)
+
+
+class PasswordHashingTests(ApiTestCase):
+    """argon2 work must not block the event loop for other requests.
+
+    Latency under a login storm is measured by tests/benchmarks/login_storm_bench.py.
+    """
+
+    LOGIN_STORM = 8
+
+    async def test_requests_are_served_while_logins_hash(self):
+        await self.login()
+        storm = asyncio.gather(*[
+            self.client.post("/auth/login", json={"email": "lifter@example.com", "password": "password123"})
+            for _ in range(self.LOGIN_STORM)
+        ])
+        while password_hasher.pending == 0 and not storm.done():
+            await asyncio.sleep(0)
+        # Hashing on the event loop would finish each hash before this coroutine could observe it pending
+        served_while_hashing = 0
+        while password_hasher.pending > 0:
+            response = await self.client.get("/workouts/workouts/user1")
+            self.assertEqual(response.status_code, 200)
+            if password_hasher.pending > 0:
+                served_while_hashing += 1
+            # The in-memory database never suspends, so yield for the finished hashes to be collected
+            await asyncio.sleep(0)
+        responses = await storm
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertGreater(served_while_hashing, 0)
+
+
+class IndexTests(ApiTestCase):
+    """Tests for the declarative index registry."""
+
+    async def test_ensure_indexes_only_creates_missing(self):
+        created = await indexes.ensure_indexes(self.db)
+        expected = [index.document["name"] for models in indexes.INDEXES.values() for index in models]
+        self.assertEqual(sorted(created), sorted(expected))
+        self.assertEqual(await indexes.ensure_indexes(self.db), [])
+
+        users = await self.db["Users"].index_information()
+        self.assertTrue(users["email_unique"]["unique"])
+
+    async def test_duplicate_calorie_days_are_merged_before_the_unique_index(self):
+        day = datetime(2025, 5, 1)
+        await self.db["Calories"].insert_many([
+            {"user_id": "user1", "date": day, "calorie_goal": 2000, "total_calories": 300,
+             "food": [{"name": "Oats", "calories": 300, "timestamp": day + timedelta(hours=8)}]},
+            {"user_id": "user1", "date": day, "calorie_goal": 2000, "total_calories": 500,
+             "food": [{"name": "Rice", "calories": 500, "timestamp": day + timedelta(hours=7)}]},
+            {"user_id": "user1", "date": day + timedelta(days=1), "calorie_goal": 2000, "total_calories": 0, "food": []},
+        ])
+        self.assertIn("user_id_date_unique", await indexes.ensure_indexes(self.db))
+
+        merged = await self.db["Calories"].find({"user_id": "user1", "date": day}).to_list(None)
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(merged[0]["total_calories"], 800)
+        self.assertEqual([entry["name"] for entry in merged[0]["food"]], ["Rice", "Oats"])
+        self.assertEqual(await self.db["Calories"].count_documents({}), 2)
+
+    async def test_unbuildable_unique_index_fails_startup(self):
+        await self.db["Users"].insert_many([{"email": "twice@example.com"}, {"email": "twice@example.com"}])
+        with self.assertRaises(indexes.IndexBuildError):
+            await indexes.ensure_indexes(self.db)
+
+
+class CalorieLogTests(ApiTestCase):
+    """Tests for the single round-trip calorie upsert."""
+
+    async def test_concurrent_logs_share_one_day_document(self):
+        await indexes.ensure_indexes(self.db)
+        user = await self.login()
+        responses = await asyncio.gather(*[
+            self.client.post(f"/calories/log/{user['_id']}", json={"food": f"Snack {i}", "calories": 100})
+            for i in range(20)
+        ])
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+
+        days = await self.db["Calories"].find({"user_id": user["_id"]}).to_list(None)
+        self.assertEqual(len(days), 1)
+        self.assertEqual(days[0]["total_calories"], 2000)
+        self.assertEqual(len(days[0]["food"]), 20)
+        self.assertEqual(days[0]["calorie_goal"], 2000)
+
+    async def test_log_uses_updated_calorie_goal(self):
+        user = await self.login()
+        await self.client.post(f"/calories/log/{user['_id']}", json={"food": "Oats", "calories": 300})
+        await self.db["Calories"].delete_many({})
+        await self.client.put(f"/auth/user/{user['_id']}", json={"calorie_goal": 2500})
+
+        response = await self.client.post(f"/calories/log/{user['_id']}", json={"food": "Oats", "calories": 300})
+        self.assertEqual(response.json()["calorie_goal"], 2500)
+        self.assertEqual(response.json()["total_calories"], 300)
+
+
+    async def test_batch_log_groups_entries_by_utc_day(self):
+        await indexes.ensure_indexes(self.db)
+        user = await self.login()
+        response = await self.client.post(f"/calories/log/{user['_id']}/batch", json={"entries": [
+            {"name": "Dinner", "calories": 700, "timestamp": "2025-05-01T19:00:00Z"},
+            {"name": "Late snack", "calories": 200, "timestamp": "2025-05-02T00:30:00+02:00"},
+            {"name": "Breakfast", "calories": 400, "timestamp": "2025-05-02T08:00:00Z"},
+            {"name": "Lunch", "calories": 600, "timestamp": "2025-05-01T12:00:00"}
+        ]})
+        self.assertEqual(response.status_code, 200)
+        days = response.json()
+        self.assertEqual([day["total_calories"] for day in days], [1500, 400])
+        self.assertEqual([food["name"] for food in days[0]["food"]], ["Lunch", "Dinner", "Late snack"])
+
+        response = await self.client.post(f"/calories/log/{user['_id']}/batch", json={"entries": [
+            {"name": "Shake", "calories": 300, "timestamp": "2025-05-02T15:00:00Z"}
+        ]})
+        self.assertEqual(response.json()[0]["total_calories"], 700)
+        self.assertEqual(await self.db["Calories"].count_documents({"user_id": user["_id"]}), 2)
+
+
+    async def test_range_rolls_up_days_into_buckets(self):
+        user = await self.login()
+        entries = [
+            {"name": "Pasta", "calories": 2500, "timestamp": "2025-04-28T12:00:00Z"},
+            {"name": "Salad", "calories": 1500, "timestamp": "2025-04-29T12:00:00Z"},
+            {"name": "Soup", "calories": 500, "timestamp": "2025-04-29T18:00:00Z"},
+            {"name": "Pizza", "calories": 1800, "timestamp": "2025-05-05T12:00:00Z"}
+        ]
+        await self.client.post(f"/calories/log/{user['_id']}/batch", json={"entries": entries})
+
+        params = {"from": "2025-04-01T00:00:00Z", "to": "2025-06-01T00:00:00Z"}
+        weeks = (await self.client.get(f"/calories/range/{user['_id']}", params={**params, "bucket": "week"})).json()
+        self.assertEqual([week["bucket"] for week in weeks], ["2025-W18", "2025-W19"])
+        self.assertEqual(weeks[0]["start"], "2025-04-28T00:00:00+00:00")
+        self.assertEqual(weeks[0]["total_calories"], 4500)
+        self.assertEqual(weeks[0]["days_logged"], 2)
+        self.assertEqual(weeks[0]["goal_adherence"], 0.5)
+        self.assertEqual(weeks[0]["food_count"], 3)
+
+        months = (await self.client.get(f"/calories/range/{user['_id']}", params={**params, "bucket": "month"})).json()
+        self.assertEqual([(month["bucket"], month["total_calories"]) for month in months], [("2025-04", 4500), ("2025-05", 1800)])
+
+        response = await self.client.get(f"/calories/range/{user['_id']}", params={"from": "2025-06-01", "to": "2025-05-01"})
+        self.assertEqual(response.status_code, 400)
+
+        empty = await self.client.get(f"/calories/range/{user['_id']}", params={"from": "2024-01-01", "to": "2024-02-01"})
+        self.assertEqual(empty.json(), [])
+        with mock.patch.object(calories, "range_pipeline", return_value=[{"$no_such_stage": {}}]):
+            failed = await self.client.get(f"/calories/range/{user['_id']}", params=params)
+        self.assertEqual(failed.status_code, 500)
+
+
+class NutritionTests(ApiTestCase):
+    """Tests for the vectorized TDEE and macro targets."""
+
+    PROFILE = {"weight_kg": 80, "height_cm": 180, "age": 30, "sex": "male", "activity": "moderate", "goal": "maintain"}
+
+    async def test_scenario_sweep_matches_single_profiles(self):
+        female = {**self.PROFILE, "sex": "female", "weight_kg": 62.5}
+        response = await self.client.post("/calories/macros/scenarios", json={
+            "profiles": [self.PROFILE, female],
+            "activities": ["sedentary", "active"],
+            "goals": ["lose", "maintain", "gain"]
+        })
+        self.assertEqual(response.status_code, 200)
+        scenarios = response.json()
+        self.assertEqual(len(scenarios), 12)
+        for scenario in scenarios:
+            single = nutrition.compute_macros(*(scenario[field] for field in nutrition.PROFILE_FIELDS))
+            self.assertEqual({name: scenario[name] for name in single}, {name: int(value) for name, value in single.items()})
+
+        # Harris-Benedict BMR 1853.63 at 1.55, protein 2.2 g/kg, 25% of calories from fat
+        self.assertEqual(nutrition.macros_for(self.PROFILE),
+                         {"profile_hash": nutrition.profile_hash(self.PROFILE), "tdee": 2873, "protein": 176, "carbs": 362, "fat": 80})
+
+        response = await self.client.post("/calories/macros/scenarios", json={"profiles": [{**self.PROFILE, "activity": "couch"}]})
+        self.assertEqual(response.status_code, 422)
+
+    async def test_saved_target_is_stored_and_used_by_the_calorie_log(self):
+        user = await self.login()
+        self.assertEqual((await self.client.get(f"/calories/macros/{user['_id']}")).status_code, 404)
+
+        saved = await self.client.post(f"/calories/macros/{user['_id']}", json={**self.PROFILE, "goal": "lose"})
+        self.assertEqual(saved.status_code, 200)
+        self.assertEqual(saved.json()["tdee"], 2373)
+        stored = await self.db["Macros"].find_one({"user_id": user["_id"]})
+        self.assertEqual(stored["profile"]["goal"], "lose")
+
+        # Saving the same profile again is served from the stored document
+        again = await self.client.post(f"/calories/macros/{user['_id']}", json={**self.PROFILE, "goal": "lose"})
+        self.assertEqual(again.json()["updated_at"], saved.json()["updated_at"])
+
+        logged = await self.client.post(f"/calories/log/{user['_id']}", json={"food": "Oats", "calories": 300})
+        self.assertEqual(logged.json()["calorie_goal"], 2373)
+        self.assertEqual((await self.client.get(f"/calories/macros/{user['_id']}")).json()["protein"], 176)
+
+    async def test_most_recently_set_calorie_target_wins(self):
+        user = await self.login()
+        saved = await self.client.post(f"/calories/macros/{user['_id']}", json=self.PROFILE)
+        tdee = saved.json()["tdee"]
+        await self.client.put(f"/auth/user/{user['_id']}", json={"calorie_goal": 1800})
+        logged = await self.client.post(f"/calories/log/{user['_id']}", json={"food": "Oats", "calories": 300})
+        self.assertEqual(logged.json()["calorie_goal"], 1800)
+
+        # Re-saving the same profile makes its TDEE the target again
+        await self.db["Calories"].delete_many({})
+        await self.client.post(f"/calories/macros/{user['_id']}", json=self.PROFILE)
+        logged = await self.client.post(f"/calories/log/{user['_id']}", json={"food": "Oats", "calories": 300})
+        self.assertEqual(logged.json()["calorie_goal"], tdee)
+
+
+class WorkoutListTests(ApiTestCase):
+    """Tests for keyset pagination of a user's workouts."""
+
+    async def test_pages_follow_cursor_without_truncation(self):
+        for i in range(7):
+            await self.client.post("/workouts/workouts", json={"name": f"Workout {i}", "exercises": ["Squat"], "user_id": "user1"})
+
+        names, cursor = [], None
+        while True:
+            params = {"limit": 3, "fields": "name"}
+            if cursor:
+                params["cursor"] = cursor
+            response = await self.client.get("/workouts/workouts/user1", params=params)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(all(set(workout) == {"_id", "name"} for workout in response.json()))
+            names.extend(workout["name"] for workout in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        self.assertEqual(names, [f"Workout {i}" for i in range(7)])
+
+    async def test_legacy_workouts_without_created_at_are_paged_first(self):
+        await self.db["Workouts"].insert_many([{"name": f"Legacy {i}", "exercises": ["Squat"], "user_id": "user1"} for i in range(3)])
+        for i in range(2):
+            await self.client.post("/workouts/workouts", json={"name": f"Workout {i}", "exercises": ["Squat"], "user_id": "user1"})
+
+        names, cursor = [], None
+        while True:
+            params = {"limit": 2, "fields": "name"}
+            if cursor:
+                params["cursor"] = cursor
+            response = await self.client.get("/workouts/workouts/user1", params=params)
+            self.assertEqual(response.status_code, 200)
+            names.extend(workout["name"] for workout in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        self.assertEqual(names, ["Legacy 0", "Legacy 1", "Legacy 2", "Workout 0", "Workout 1"])
+
+    async def test_unchanged_page_returns_304(self):
+        await self.client.post("/workouts/workouts", json={"name": "Push", "exercises": ["Bench Press"], "user_id": "user1"})
+        first = await self.client.get("/workouts/workouts/user1")
+        etag = first.headers["ETag"]
+
+        cached = await self.client.get("/workouts/workouts/user1", headers={"If-None-Match": etag})
+        self.assertEqual(cached.status_code, 304)
+
+        await self.client.post("/workouts/workouts", json={"name": "Pull", "exercises": ["Row"], "user_id": "user1"})
+        changed = await self.client.get("/workouts/workouts/user1", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()), 2)
+
+    async def test_fetch_by_id_is_cached_until_updated(self):
+        created = await self.client.post("/workouts/workouts", json={"name": "Push", "exercises": ["Bench Press"], "user_id": "user1"})
+        workout_id = created.json()["id"]
+
+        first = await self.client.get(f"/workouts/workout/{workout_id}")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((first.json()["_id"], first.json()["name"]), (workout_id, "Push"))
+        await self.client.get(f"/workouts/workout/{workout_id}")
+        self.assertEqual(workout_templates.template_cache.stats()["hits"], 1)
+
+        await self.client.put(f"/workouts/workouts/{workout_id}", json={"name": "Push", "exercises": ["Dips"], "user_id": "user1"})
+        updated = await self.client.get(f"/workouts/workout/{workout_id}")
+        self.assertEqual(updated.json()["exercises"], ["Dips"])
+
+        await self.client.delete(f"/workouts/workouts/{workout_id}")
+        self.assertEqual((await self.client.get(f"/workouts/workout/{workout_id}")).status_code, 404)
+
+    async def test_fetch_by_id_rejects_invalid_ids_without_querying(self):
+        with mock.patch.object(workout_templates, "workouts_collection") as collection:
+            response = await self.client.get("/workouts/workout/not-an-id")
+        self.assertEqual(response.status_code, 400)
+        collection.find_one.assert_not_called()
+
+        response = await self.client.get("/workouts/workouts/user1/Missing")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_rejects_unknown_fields_and_bad_cursors(self):
+        response = await self.client.get("/workouts/workouts/user1", params={"fields": "name,password"})
+        self.assertEqual(response.status_code, 400)
+        response = await self.client.get("/workouts/workouts/user1", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+class WorkoutStatsTests(ApiTestCase):
+    """Tests for the maintained per-user workout stats."""
+
+    async def test_counts_are_maintained_after_backfill(self):
+        for i in range(120):
+            await self.db["Workouts"].insert_one({"name": f"Workout {i}", "exercises": [], "user_id": "user1"})
+        self.assertEqual((await self.client.get("/workouts/workouts_count/user1")).json(), 120)
+
+        response = await self.client.post("/workouts/workouts", json={"name": "Legs", "exercises": ["Squat"], "user_id": "user1"})
+        self.assertEqual((await self.client.get("/workouts/workouts_count/user1")).json(), 121)
+        await self.client.delete(f"/workouts/workouts/{response.json()['id']}")
+        self.assertEqual((await self.client.get("/workouts/workouts_count/user1")).json(), 120)
+
+    async def test_stats_report_sessions_and_weekly_streak(self):
+        now = datetime.now(timezone.utc)
+        await self.client.get("/workouts/stats/user1")
+        for weeks_ago in (0, 1, 2, 4):
+            completed_at = (now - timedelta(weeks=weeks_ago)).isoformat()
+            await self.complete_workout("user1", {"Squat": []}, completed_at=completed_at)
+
+        stats = (await self.client.get("/workouts/stats/user1")).json()
+        self.assertEqual(stats["template_count"], 0)
+        self.assertEqual(stats["completed_count"], 4)
+        self.assertEqual(stats["weekly_streak"], 3)
+        self.assertEqual(datetime.fromisoformat(stats["last_completed_at"]).replace(tzinfo=timezone.utc),
+                         now.replace(microsecond=now.microsecond // 1000 * 1000))
+
+
+    async def test_template_changes_before_the_first_backfill_are_kept(self):
+        await self.client.post("/workouts/workouts", json={"name": "Push", "exercises": ["Bench Press"], "user_id": "user1"})
+        build = workout_stats.build_workout_stats
+
+        async def build_while_a_template_is_added(user_id):
+            stats = await build(user_id)
+            # Lands after the backfill counted the templates, before it writes its result
+            await self.client.post("/workouts/workouts", json={"name": "Pull", "exercises": ["Row"], "user_id": user_id})
+            return stats
+
+        with mock.patch.object(workout_stats, "build_workout_stats", build_while_a_template_is_added):
+            await self.client.get("/workouts/stats/user1")
+        self.assertEqual((await self.client.get("/workouts/stats/user1")).json()["template_count"], 2)
+
+    async def test_applied_workouts_are_bounded(self):
+        await self.client.get("/workouts/stats/user1")
+        with mock.patch.object(applied, "APPLIED_WINDOW", 2):
+            for day in range(1, 5):
+                await self.complete_workout("user1", {"Squat": [{"kg": "100", "reps": "5", "notes": ""}]},
+                                            completed_at=f"2025-05-0{day}T10:00:00.000Z")
+        stats = await self.db["UserStats"].find_one({"user_id": "user1"})
+        history = await self.db["ExerciseHistory"].find_one({"user_id": "user1"})
+        self.assertEqual((stats["completed_count"], len(stats["applied_workouts"])), (4, 2))
+        self.assertEqual((len(history["kg"]), len(history["applied_workouts"])), (4, 2))
+
+
+class DashboardTests(ApiTestCase):
+    """Tests for the aggregated, cached dashboard endpoint."""
+
+    async def test_dashboard_combines_and_refreshes_after_writes(self):
+        user = await self.login()
+        user_id = user["_id"]
+        await self.client.post(f"/calories/log/{user_id}", json={"food": "Oats", "calories": 350})
+        await self.complete_workout(user_id, {"Squat": [{"kg": "100", "reps": "5", "notes": ""}]},
+                                    completed_at=datetime.now(timezone.utc).isoformat())
+
+        body = (await self.client.get(f"/dashboard/{user_id}")).json()
+        self.assertEqual(body["calories"], {"total_calories": 350, "calorie_goal": 2000})
+        self.assertEqual(body["workouts"]["completed_count"], 1)
+        self.assertEqual(body["workouts"]["weekly_streak"], 1)
+        self.assertEqual(body["exercises"], ["Squat"])
+
+        hits = dashboard.dashboard_cache.hits
+        await self.client.get(f"/dashboard/{user_id}")
+        self.assertEqual(dashboard.dashboard_cache.hits, hits + 1)
+
+        await self.client.post(f"/calories/log/{user_id}", json={"food": "Rice", "calories": 400})
+        await self.client.post("/workouts/workouts", json={"name": "Legs", "exercises": ["Squat"], "user_id": user_id})
+        body = (await self.client.get(f"/dashboard/{user_id}")).json()
+        self.assertEqual(body["calories"]["total_calories"], 750)
+        self.assertEqual(body["workouts"]["template_count"], 1)
+
+    async def test_unknown_user_is_404(self):
+        response = await self.client.get(f"/dashboard/{'0' * 24}")
+        self.assertEqual(response.status_code, 404)
+
+
+class SerializationTests(ApiTestCase):
+    """Tests for the orjson response layer."""
+
+    async def test_raw_documents_are_encoded(self):
+        user = await self.login()
+        response = await self.client.get(f"/auth/user/{user['_id']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["_id"], user["_id"])
+        self.assertIsInstance(datetime.fromisoformat(response.json()["createdAt"]), datetime)
+
+    def test_bson_values_match_jsonable_encoder(self):
+        document = {"_id": ObjectId(), "date": datetime(2025, 5, 1, tzinfo=timezone.utc), "sets": [{"kg": 60.5}]}
+        self.assertEqual(json.loads(responses.dumps(document)), jsonable_encoder(document, custom_encoder={ObjectId: str}))
+
+
+class ExportTests(ApiTestCase):
+    """Tests for the streaming history export."""
+
+    async def seed_history(self, user_id):
+        await self.complete_workout(user_id, {"Squat": [{"kg": "100", "reps": "5", "notes": ""},
+                                                        {"kg": "105", "reps": "3", "notes": "PR"}]})
+        await self.client.post(f"/calories/log/{user_id}/batch", json={"entries": [
+            {"name": "Oats", "calories": 350, "timestamp": "2025-05-01T08:00:00Z"},
+            {"name": "Rice", "calories": 600, "timestamp": "2025-05-02T13:00:00Z"}
+        ]})
+
+    async def test_ndjson_export_streams_every_document(self):
+        user = await self.login()
+        await self.seed_history(user["_id"])
+
+        response = await self.client.get(f"/export/{user['_id']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        records = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([record["type"] for record in records], ["workout", "calories", "calories"])
+        self.assertEqual(records[0]["exercises"]["Squat"][1]["notes"], "PR")
+        self.assertEqual(records[2]["total_calories"], 600)
+
+    async def test_csv_export_has_one_row_per_set_and_food(self):
+        user = await self.login()
+        await self.seed_history(user["_id"])
+
+        response = await self.client.get(f"/export/{user['_id']}", params={"format": "csv"})
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        self.assertEqual([(row["type"], row["exercise"] or row["food"]) for row in rows],
+                         [("set", "Squat"), ("set", "Squat"), ("food", "Oats"), ("food", "Rice")])
+        self.assertEqual(rows[1]["kg"], "105.0")
+        self.assertEqual(rows[3]["date"], "2025-05-02T13:00:00")
+
+
+class ImportTests(ApiTestCase):
+    """Tests for bulk importing completed workouts."""
+
+    async def test_csv_import_groups_sets_into_sessions_and_reports_bad_rows(self):
+        user = await self.login()
+        await self.client.get(f"/workouts/stats/{user['_id']}")
+        body = (
+            "date,workout,exercise,kg,reps,notes\n"
+            "2025-04-01T10:00:00Z,Legs,Squat,100,5,\n"
+            "2025-04-01T10:00:00Z,Legs,Squat,105,3,\"grinder,\nbut clean\"\n"
+            "2025-04-01T10:00:00Z,Legs,Squat\n"
+            "2025-04-01T10:00:00Z,Legs,Squat,abc,5,\n"
+            "2025-04-08T10:00:00Z,Legs,Squat,110,3,\n"
+        )
+        response = await self.client.post(f"/import/{user['_id']}", params={"format": "csv"}, content=body)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result["imported"], result["failed"], result["unparsed"]), (2, 1, 1))
+        self.assertEqual([error["row"] for error in result["errors"]], [3])
+        self.assertEqual(result["unparsed_values"], [{"row": 4, "exercise": "Squat", "set": 2, "field": "kg", "value": "abc"}])
+
+        history = (await self.client.get(f"/workouts/exercises/{user['_id']}")).json()
+        self.assertEqual([s["kg"] for s in history["Squat"]], [100, 105, None, 110])
+        self.assertEqual(history["Squat"][2]["notes"], "kg: abc")
+        self.assertEqual(history["Squat"][1]["notes"], "grinder,\nbut clean")
+        stats = (await self.client.get(f"/workouts/stats/{user['_id']}")).json()
+        self.assertEqual(stats["completed_count"], 2)
+
+    async def test_ndjson_export_round_trips_through_import(self):
+        source = await self.login()
+        target = await self.login(email="other@example.com")
+        await self.complete_workout(source["_id"], {"Bench Press": [{"kg": "80", "reps": "8", "notes": ""}]})
+        await self.client.post(f"/calories/log/{source['_id']}", json={"name": "Oats", "calories": 350})
+        exported = (await self.client.get(f"/export/{source['_id']}")).text
+
+        response = await self.client.post(f"/import/{target['_id']}", content=exported + '{"workout_name": "Push"}\n')
+        result = response.json()
+        self.assertEqual((result["imported"], result["failed"]), (1, 1))
+        self.assertIn("exercises", result["errors"][0]["error"])
+        history = (await self.client.get(f"/workouts/exercises/{target['_id']}")).json()
+        self.assertEqual(history["Bench Press"][0]["kg"], 80)
+
+
+    async def test_imported_sessions_are_merged_into_history_by_date(self):
+        user = await self.login()
+        await self.client.get(f"/workouts/stats/{user['_id']}")
+        await self.complete_workout(user["_id"], {"Squat": [{"kg": "120", "reps": "3", "notes": ""}],
+                                                  "Bench Press": [{"kg": "80", "reps": "5", "notes": ""}]})
+        squat = await self.db["ExerciseHistory"].find_one({"exercise": "Squat"})
+        bench = await self.db["ExerciseHistory"].find_one({"exercise": "Bench Press"})
+        body = (
+            "date,workout,exercise,kg,reps,notes\n"
+            "2025-04-01T10:00:00Z,Legs,Squat,100,5,\n"
+            "2025-04-08T10:00:00Z,Legs,Squat,110,3,\n"
+        )
+        response = await self.client.post(f"/import/{user['_id']}", params={"format": "csv"}, content=body)
+        self.assertEqual(response.json()["imported"], 2)
+
+        history = (await self.client.get(f"/workouts/exercises/{user['_id']}")).json()
+        self.assertEqual([s["kg"] for s in history["Squat"]], [100, 110, 120])
+        self.assertEqual((await self.client.get(f"/workouts/stats/{user['_id']}")).json()["completed_count"], 3)
+        # Merged in place; exercises the import did not log are left untouched
+        self.assertEqual((await self.db["ExerciseHistory"].find_one({"exercise": "Squat"}))["_id"], squat["_id"])
+        self.assertEqual(await self.db["ExerciseHistory"].find_one({"exercise": "Bench Press"}), bench)
+        self.assertEqual(await self.db["CompletedWorkouts"].count_documents({"derived_pending": {"$exists": True}}), 0)
+
+    async def test_interrupted_import_is_recovered_by_the_sweeper(self):
+        user = await self.login()
+        await self.client.get(f"/workouts/stats/{user['_id']}")
+        body = (
+            "date,workout,exercise,kg,reps,notes\n"
+            "2025-04-01T10:00:00Z,Legs,Squat,100,5,\n"
+            "2025-04-08T10:00:00Z,Legs,Squat,110,3,\n"
+        )
+        with mock.patch.object(imports, "merge_completed_workouts", side_effect=RuntimeError("killed")):
+            response = await self.client.post(f"/import/{user['_id']}", params={"format": "csv"}, content=body)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(await self.db["CompletedWorkouts"].count_documents({"derived_pending": {"$exists": True}}), 2)
+        # Still claimed by the import until its lease lapses
+        self.assertEqual(await derived_updates.recover_pending_workouts(), 0)
+
+        await self.db["CompletedWorkouts"].update_many({}, {"$set": {
+            "derived_claimed_until": datetime.utcnow() - timedelta(seconds=1)
+        }})
+        self.assertEqual((await maintenance.Sweeper(caches={}, pause=0).run_once())["recovered_workouts"], 2)
+        self.assertTrue(await derived_updates.derived_queue.drain(timeout=5))
+        history = (await self.client.get(f"/workouts/exercises/{user['_id']}")).json()
+        self.assertEqual([s["kg"] for s in history["Squat"]], [100, 110])
+        self.assertEqual((await self.client.get(f"/workouts/stats/{user['_id']}")).json()["completed_count"], 2)
+        self.assertEqual(await self.db["CompletedWorkouts"].count_documents({"derived_pending": {"$exists": True}}), 0)
+
+class NumericSetTests(ApiTestCase):
+    """Tests for numeric set storage and the backfill of older string sets."""
+
+    async def test_sets_are_stored_as_numbers(self):
+        await self.complete_workout("user1", {"Squat": [{"kg": "100.5", "reps": "5", "notes": ""},
+                                                        {"kg": "", "reps": "8.9", "notes": "warmup"}]})
+        workout = await self.db["CompletedWorkouts"].find_one({"user_id": "user1"})
+        self.assertEqual(workout["exercises"]["Squat"][0], {"kg": 100.5, "reps": 5, "notes": ""})
+        self.assertEqual(workout["exercises"]["Squat"][1], {"kg": None, "reps": 8, "notes": "warmup"})
+
+        history = await self.db["ExerciseHistory"].find_one({"user_id": "user1", "exercise": "Squat"})
+        self.assertEqual(history["kg"], [100.5, None])
+        self.assertEqual(history["reps"], [5, 8])
+        self.assertEqual(len(history["completed_at"]), 2)
+
+    async def test_sets_that_are_not_numbers_are_kept_in_notes_and_reported(self):
+        response = await self.client.post("/workouts/completed", json={
+            "user_id": "user1", "workout_name": "Push", "completed_at": "2025-05-02T10:00:00.000Z",
+            "exercises": {"Dips": [{"kg": "20", "reps": "8", "notes": ""},
+                                   {"kg": "BW", "reps": "max", "notes": "slow"}]}
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["unparsed"], [
+            {"exercise": "Dips", "set": 1, "field": "kg", "value": "BW"},
+            {"exercise": "Dips", "set": 1, "field": "reps", "value": "max"},
+        ])
+        await asyncio.sleep(0)
+        await derived_updates.derived_queue.drain()
+
+        workout = await self.db["CompletedWorkouts"].find_one({"user_id": "user1"})
+        self.assertEqual(workout["exercises"]["Dips"][1], {"kg": None, "reps": None, "notes": "slow; kg: BW; reps: max"})
+        history = (await self.client.get("/workouts/exercises/user1")).json()
+        self.assertEqual([s["kg"] for s in history["Dips"]], [20, None])
+
+    async def test_backfill_resumes_from_checkpoint(self):
+        await self.db["CompletedWorkouts"].insert_many([
+            {"user_id": "user1", "workout_name": "Legs", "completed_at": f"2025-05-0{i + 1}T10:00:00Z",
+             "exercises": {"Squat": [{"kg": str(100 + i), "reps": "5", "notes": ""}]}}
+            for i in range(5)
+        ])
+        await self.db["ExerciseHistory"].insert_one({"user_id": "user1", "exercise": "Squat", "sets": []})
+
+        original = set_backfill.completed_workouts_collection.bulk_write
+        calls = 0
+
+        async def fail_second_batch(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise RuntimeError("interrupted")
+            return await original(*args, **kwargs)
+
+        with mock.patch.object(set_backfill.completed_workouts_collection, "bulk_write", fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                await set_backfill.backfill_numeric_sets(batch_size=2)
+        checkpoint = await self.db["Migrations"].find_one({"_id": set_backfill.MIGRATION_ID})
+        self.assertEqual(checkpoint["converted"], 2)
+
+        self.assertEqual(await set_backfill.backfill_numeric_sets(batch_size=2), 3)
+        kgs = [w["exercises"]["Squat"][0]["kg"] async for w in self.db["CompletedWorkouts"].find().sort("_id", 1)]
+        self.assertEqual(kgs, [100, 101, 102, 103, 104])
+        history = (await self.client.get("/workouts/exercises/user1")).json()
+        self.assertEqual([s["kg"] for s in history["Squat"]], [100, 101, 102, 103, 104])
+        self.assertEqual(await set_backfill.backfill_numeric_sets(batch_size=2), 0)
+
+
+class PersonalRecordTests(ApiTestCase):
+    """Tests for the per-exercise personal record index."""
+
+    async def test_records_only_move_upwards(self):
+        await self.complete_workout("user1", {"Bench Press": [{"kg": "100", "reps": "5", "notes": ""},
+                                                              {"kg": "110", "reps": "1", "notes": ""}]},
+                                    completed_at="2025-05-01T10:00:00Z")
+        await self.complete_workout("user1", {"Bench Press": [{"kg": "90", "reps": "10", "notes": ""},
+                                                              {"kg": "", "reps": "5", "notes": ""}]},
+                                    completed_at="2025-05-08T10:00:00Z")
+
+        response = await self.client.get("/analytics/records/user1", params={"exercise": "Bench Press"})
+        self.assertEqual(response.status_code, 200)
+        records = response.json()
+        self.assertEqual(records["heaviest"], {"kg": 110, "reps": 1, "completed_at": "2025-05-01T10:00:00Z"})
+        self.assertEqual(records["best_volume"]["volume"], 900)
+        self.assertAlmostEqual(records["e1rm"]["epley"]["value"], 120)
+        self.assertAlmostEqual(records["e1rm"]["brzycki"]["value"], 90 * 36 / 27)
+        self.assertEqual({reps: record["kg"] for reps, record in records["rep_maxes"].items()},
+                         {"1": 110, "5": 100, "10": 90})
+
+        missing = await self.client.get("/analytics/records/user1", params={"exercise": "Squat"})
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_rebuild_matches_incremental_records(self):
+        for kg in ("100", "120", "110"):
+            await self.complete_workout("user1", {"Squat": [{"kg": kg, "reps": "3", "notes": ""}]})
+        expected = await personal_records.get_personal_records("user1", "Squat")
+
+        self.assertEqual(await personal_records.rebuild_personal_records("user1"), 3)
+        rebuilt = await personal_records.get_personal_records("user1", "Squat")
+        for record in ("heaviest", "best_volume", "e1rm", "rep_maxes"):
+            self.assertEqual(rebuilt[record], expected[record])
+
+
+class DerivedQueueTests(ApiTestCase):
+    """Tests for applying completed-workout derived updates in the background."""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self._original_queue = derived_updates.derived_queue
+
+    async def asyncTearDown(self):
+        await derived_updates.derived_queue.drain()
+        derived_updates.derived_queue = self._original_queue
+        await super().asyncTearDown()
+
+    async def test_queued_updates_survive_a_restart(self):
+        await self.client.get("/workouts/stats/user1")
+        # A queue whose workers never run stands in for a process killed before draining
+        derived_updates.derived_queue = JobQueue(workers=0, max_queue=100)
+        derived_updates.derived_queue.start()
+        for kg in ("100", "105", "110"):
+            await self.complete_workout("user1", {"Squat": [{"kg": kg, "reps": "5", "notes": ""}]})
+        self.assertEqual(derived_updates.derived_queue.stats()["queue_depth"], 3)
+        self.assertEqual(await self.db["ExerciseHistory"].count_documents({}), 0)
+
+        derived_updates.derived_queue = JobQueue(workers=2, max_queue=100)
+        derived_updates.derived_queue.start()
+        self.assertEqual(await derived_updates.recover_pending_workouts(), 3)
+        self.assertTrue(await derived_updates.derived_queue.drain(timeout=5))
+
+        history = (await self.client.get("/workouts/exercises/user1")).json()
+        self.assertEqual(sorted(s["kg"] for s in history["Squat"]), [100, 105, 110])
+        self.assertEqual((await self.client.get("/workouts/stats/user1")).json()["completed_count"], 3)
+        records = (await self.client.get("/analytics/records/user1", params={"exercise": "Squat"})).json()
+        self.assertEqual(records["heaviest"]["kg"], 110)
+        self.assertEqual(await self.db["CompletedWorkouts"].count_documents({"derived_pending": {"$exists": True}}), 0)
+
+    async def test_failed_step_is_retried_without_repeating_earlier_steps(self):
+        derived_updates.derived_queue = JobQueue(workers=1, max_queue=10, retries=2, backoff=0)
+        derived_updates.derived_queue.start()
+        record = derived_updates.DERIVED_STEPS["records"]
+        attempts = 0
+
+        async def flaky_records(workout):
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise RuntimeError("transient")
+            await record(workout)
+
+        with mock.patch.dict(derived_updates.DERIVED_STEPS, {"records": flaky_records}):
+            await self.complete_workout("user1", {"Bench Press": [{"kg": "80", "reps": "5", "notes": ""}]})
+            self.assertTrue(await derived_updates.derived_queue.drain(timeout=5))
+
+        stats = derived_updates.derived_queue.stats()
+        self.assertEqual((stats["processed"], stats["retried"], stats["failed"]), (1, 1, 0))
+        history = (await self.client.get("/workouts/exercises/user1")).json()
+        self.assertEqual(len(history["Bench Press"]), 1)
+
+
+    async def test_repeated_recovery_applies_each_workout_once(self):
+        await self.client.get("/workouts/stats/user1")
+        derived_updates.derived_queue = JobQueue(workers=0, max_queue=10)
+        derived_updates.derived_queue.start()
+        await self.complete_workout("user1", {"Squat": [{"kg": "100", "reps": "5", "notes": ""}]})
+
+        # Two workers recovering the same backlog after a rolling restart
+        derived_updates.derived_queue = JobQueue(workers=2, max_queue=10)
+        derived_updates.derived_queue.start()
+        self.assertEqual(await derived_updates.recover_pending_workouts(), 1)
+        self.assertEqual(await derived_updates.recover_pending_workouts(), 1)
+        self.assertTrue(await derived_updates.derived_queue.drain(timeout=5))
+
+        history = (await self.client.get("/workouts/exercises/user1")).json()
+        self.assertEqual(len(history["Squat"]), 1)
+        self.assertEqual((await self.client.get("/workouts/stats/user1")).json()["completed_count"], 1)
+
+        # Replaying a step directly, as a retry after a partial failure would, changes nothing
+        workout = await self.db["CompletedWorkouts"].find_one({"user_id": "user1"})
+        for step in ("history", "stats"):
+            await derived_updates.DERIVED_STEPS[step](workout)
+        history = (await self.client.get("/workouts/exercises/user1")).json()
+        self.assertEqual(len(history["Squat"]), 1)
+        self.assertEqual((await self.client.get("/workouts/stats/user1")).json()["completed_count"], 1)
+
+    async def test_claimed_workouts_are_left_to_their_holder_until_the_claim_lapses(self):
+        derived_updates.derived_queue = JobQueue(workers=0, max_queue=10)
+        derived_updates.derived_queue.start()
+        await self.complete_workout("user1", {"Squat": [{"kg": "100", "reps": "5", "notes": ""}]})
+        await self.db["CompletedWorkouts"].update_one({}, {"$set": {
+            "derived_claimed_by": "other-worker", "derived_claimed_until": datetime.utcnow() + timedelta(minutes=1)
+        }})
+
+        derived_updates.derived_queue = JobQueue(workers=1, max_queue=10)
+        derived_updates.derived_queue.start()
+        self.assertEqual(await derived_updates.recover_pending_workouts(), 0)
+        workout = await self.db["CompletedWorkouts"].find_one({})
+        await derived_updates.apply_derived_updates(workout)
+        self.assertEqual(await self.db["ExerciseHistory"].count_documents({}), 0)
+
+        # The holder died: once its claim lapses the sweeper's recovery picks the workout up
+        await self.db["CompletedWorkouts"].update_one({}, {"$set": {
+            "derived_claimed_until": datetime.utcnow() - timedelta(seconds=1)
+        }})
+        sweeper = maintenance.Sweeper(caches={}, pause=0)
+        self.assertEqual((await sweeper.run_once())["recovered_workouts"], 1)
+        self.assertTrue(await derived_updates.derived_queue.drain(timeout=5))
+        self.assertEqual(await self.db["ExerciseHistory"].count_documents({}), 1)
+        self.assertEqual(await self.db["CompletedWorkouts"].count_documents({"derived_claimed_by": {"$exists": True}}), 0)
+
+
+    async def test_full_queue_leaves_workouts_for_the_sweeper(self):
+        derived_updates.derived_queue = JobQueue(workers=0, max_queue=1)
+        derived_updates.derived_queue.start()
+        for kg in ("100", "105"):
+            await self.complete_workout("user1", {"Squat": [{"kg": kg, "reps": "5", "notes": ""}]})
+        stats = derived_updates.derived_queue.stats()
+        self.assertEqual((stats["queue_depth"], stats["rejected"], stats["inline"]), (1, 1, 0))
+        self.assertEqual(await self.db["ExerciseHistory"].count_documents({}), 0)
+
+        derived_updates.derived_queue = JobQueue(workers=1, max_queue=10)
+        derived_updates.derived_queue.start()
+        self.assertEqual((await maintenance.Sweeper(caches={}, pause=0).run_once())["recovered_workouts"], 2)
+        self.assertTrue(await derived_updates.derived_queue.drain(timeout=5))
+        history = (await self.client.get("/workouts/exercises/user1")).json()
+        self.assertEqual([s["kg"] for s in history["Squat"]], [100, 105])
+
+
+@unittest.skipUnless(os.getenv("MONGO_TEST_URI"), "claims and leases need a real mongod; set MONGO_TEST_URI")
+class MongoDerivedQueueTests(DerivedQueueTests):
+    """The derived queue tests against a real mongod, so the claim and lease updates run on the server."""
+
+    def create_database(self):
+        self.mongo = AsyncIOMotorClient(os.getenv("MONGO_TEST_URI"))
+        return self.mongo[f"HypertrioDerivedTest{int(time.time())}"]
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        await self.mongo.drop_database(self.db.name)
+        self.mongo.close()
+
+
+class MetricsTests(ApiTestCase):
+    """Tests for request latency and Mongo command instrumentation."""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        for histogram in (metrics.request_latency, metrics.request_db_seconds, metrics.request_db_commands):
+            histogram.clear()
+
+    async def test_latency_is_recorded_per_route_template(self):
+        for user_id in ("user1", "user2"):
+            await self.client.get(f"/workouts/stats/{user_id}")
+        await self.client.get("/no/such/path")
+
+        response = await self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        lines = response.text.splitlines()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/workouts/stats/{user_id}",status="200"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/workouts/stats/{user_id}",status="200",le="+Inf"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1', lines)
+
+    def test_route_labels_never_include_request_path_values(self):
+        route = SimpleNamespace(path="/stats/{user_id}")
+        self.assertEqual(metrics.route_template({"route": route, "path": "/workouts/stats/user1"}), "/workouts/stats/{user_id}")
+        files = SimpleNamespace(path="/files/{name:path}")
+        self.assertEqual(metrics.route_template({"route": files, "path": "/export/files/a/b/c"}), "/files/{name:path}")
+        self.assertEqual(metrics.route_template({"path": "/user1/anything"}), "unmatched")
+
+    async def test_commands_are_attributed_to_the_request_that_sent_them(self):
+        async def app(scope, receive, send):
+            # Motor runs commands on executor threads with a copy of the request's context
+            for _ in range(3):
+                await asyncio.to_thread(metrics.command_metrics.succeeded,
+                                        SimpleNamespace(command_name="find", duration_micros=2000))
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async with AsyncClient(transport=ASGITransport(app=metrics.MetricsMiddleware(app)), base_url="http://test") as client:
+            await client.get("/")
+        lines = metrics.render_metrics().splitlines()
+        self.assertIn('http_request_db_commands_sum{method="GET",route="unmatched"} 3', lines)
+        self.assertIn('http_request_db_commands_bucket{method="GET",route="unmatched",le="3"} 1', lines)
+        self.assertIn('http_request_db_commands_bucket{method="GET",route="unmatched",le="2"} 0', lines)
+        db_seconds = [line for line in lines if line.startswith('http_request_db_seconds_sum{method="GET",route="unmatched"}')]
+        self.assertAlmostEqual(float(db_seconds[0].split()[-1]), 0.006)
+
+
+class SignedSessionTests(ApiTestCase):
+    """Tests for stateless HMAC-signed session tokens."""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        signer = session_tokens.SessionSigner(session_tokens.parse_signing_keys("k1:first-secret"))
+        self.enterContext(mock.patch.object(session_tokens, "SESSION_MODE", "signed"))
+        self.enterContext(mock.patch.object(session_tokens, "session_signer", signer))
+        session_tokens.revoked_sessions.clear()
+
+    async def test_signed_sessions_validate_without_a_sessions_document(self):
+        user = await self.login()
+        self.assertTrue(user["sessionId"].startswith("v1.k1."))
+        self.assertEqual(await self.db["Sessions"].count_documents({}), 0)
+
+        response = await self.client.get(f"/auth/session/{user['sessionId']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"_id": user["_id"], "email": user["email"], "name": "Lifter",
+                                           "role": "user", "sessionId": user["sessionId"]})
+
+        version, kid, claims, signature = user["sessionId"].split(".")
+        forged = session_tokens._encode(session_tokens._decode(claims).replace(b'"user"', b'"admin"'))
+        tampered = await self.client.get(f"/auth/session/{version}.{kid}.{forged}.{signature}")
+        self.assertEqual(tampered.status_code, 401)
+        for malformed in ("v1.k1.e30.%C3%A9", f"v1.k1.%C3%A9.{signature}"):
+            self.assertEqual((await self.client.get(f"/auth/session/{malformed}")).status_code, 401)
+
+    async def test_logout_revokes_the_token_for_every_worker(self):
+        user = await self.login()
+        self.assertEqual((await self.client.delete(f"/auth/session/{user['sessionId']}")).status_code, 200)
+        self.assertEqual((await self.client.get(f"/auth/session/{user['sessionId']}")).status_code, 401)
+
+        # Another worker learns of the revocation from Mongo on its next reload
+        session_tokens.revoked_sessions.clear()
+        self.assertEqual((await self.client.get(f"/auth/session/{user['sessionId']}")).status_code, 401)
+
+    async def test_tokens_survive_key_rotation_and_expire(self):
+        user = await self.login()
+        rotated = session_tokens.SessionSigner(session_tokens.parse_signing_keys("k2:second-secret,k1:first-secret"))
+        with mock.patch.object(session_tokens, "session_signer", rotated):
+            self.assertEqual((await self.client.get(f"/auth/session/{user['sessionId']}")).status_code, 200)
+            self.assertTrue((await self.login())["sessionId"].startswith("v1.k2."))
+
+        retired = session_tokens.SessionSigner(session_tokens.parse_signing_keys("k2:second-secret"))
+        with mock.patch.object(session_tokens, "session_signer", retired):
+            self.assertEqual((await self.client.get(f"/auth/session/{user['sessionId']}")).status_code, 401)
+
+        with mock.patch("services.session_tokens.time.time", return_value=time.time() + 2 * 86400):
+            response = await self.client.get(f"/auth/session/{user['sessionId']}")
+        self.assertEqual((response.status_code, response.json()["detail"]), (401, "Session expired"))
+
+
+class MaintenanceTests(ApiTestCase):
+    """Tests for the background sweeper."""
+
+    async def test_passes_purge_expired_sessions_in_bounded_batches(self):
+        now = datetime.utcnow()
+        await self.db["Sessions"].insert_many(
+            [{"sessionId": f"old{i}", "expiresAt": now - timedelta(hours=1)} for i in range(7)]
+            + [{"sessionId": f"live{i}", "expiresAt": now + timedelta(hours=1)} for i in range(2)]
+        )
+        await self.db["RevokedSessions"].insert_one({"_id": "jti", "expiresAt": now - timedelta(minutes=1)})
+        auth.session_cache.set("stale", {"_id": "user1"}, expires_at=time.time() - 1)
+        auth.session_cache.set("fresh", {"_id": "user1"})
+
+        sweeper = maintenance.Sweeper(caches={"session": auth.session_cache}, batch_size=3, pause=0, max_batches=2)
+        first = await sweeper.run_once()
+        self.assertEqual(first["removed"], {"sessions": 6, "revoked_sessions": 1, "session_cache": 1})
+        second = await sweeper.run_once()
+        self.assertEqual(second["removed"]["sessions"], 1)
+        self.assertEqual(await self.db["Sessions"].count_documents({}), 2)
+        self.assertEqual(auth.session_cache.stats()["size"], 1)
+        self.assertEqual(sweeper.stats()["removed"]["sessions"], 7)
+
+    async def test_sweeper_runs_in_the_background_until_stopped(self):
+        sweeper = maintenance.Sweeper(caches={}, interval=3600)
+        sweeper.start()
+        deadline = time.monotonic() + 5
+        while sweeper.stats()["passes"] == 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        self.assertEqual(sweeper.stats()["passes"], 1)
+        await sweeper.stop()
+        self.assertFalse(sweeper.stats()["running"])
+
+
+class LazyRouterTests(ApiTestCase):
+    """Tests for including routers on their first request."""
+
+    async def test_router_is_included_on_first_request_under_its_prefix(self):
+        app = FastAPI(default_response_class=responses.BSONResponse)
+        routers = lazy_routes.LazyRouters(app, main.ROUTERS)
+        app.add_middleware(lazy_routes.LazyRouterMiddleware, routers=routers)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/workouts/workouts_count/user1")
+            self.assertEqual((response.status_code, response.json()), (200, 0))
+            self.assertEqual(routers.loaded, {"/workouts"})
+
+            paths = (await client.get("/openapi.json")).json()["paths"]
+            self.assertEqual(routers.loaded, set(main.ROUTERS))
+            self.assertIn("/analytics/records/{user_id}", paths)
+            self.assertIn("/import/{user_id}", paths)
+
+    async def test_router_import_does_not_block_the_event_loop(self):
+        app = FastAPI(default_response_class=responses.BSONResponse)
+        routers = lazy_routes.LazyRouters(app, main.ROUTERS)
+        import_module = importlib.import_module
+
+        def slow_import(name):
+            time.sleep(0.2)
+            return import_module(name)
+
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        with mock.patch.object(lazy_routes.importlib, "import_module", slow_import):
+            await asyncio.gather(routers.load_in_thread("/analytics"), routers.load_in_thread("/analytics"))
+        ticker.cancel()
+        self.assertGreater(ticks, 5)
+        self.assertEqual(routers.loaded, {"/analytics"})
+
+
+class MongoClientTests(unittest.TestCase):
+    """Tests for the environment-configured Motor client factory."""
+
+    def test_pool_settings_come_from_env(self):
+        self.addCleanup(setattr, db.pool_metrics, "max_pool_size", db.pool_metrics.max_pool_size)
+        with mock.patch.dict(os.environ, {"MONGO_MAX_POOL_SIZE": "7", "MONGO_READ_PREFERENCE": "secondaryPreferred"}):
+            client = db.create_client("mongodb://localhost:27017")
+        self.assertEqual(client.options.pool_options.max_pool_size, 7)
+        self.assertEqual(client.read_preference.mongos_mode, "secondaryPreferred")
+        self.assertEqual(db.pool_metrics.stats()["max_pool_size"], 7)
+        client.close()
+
+    def test_saturation_is_reported_per_server_pool(self):
+        metrics = db.PoolMetrics()
+        metrics.max_pool_size = 2
+        for address in [("a", 27017), ("a", 27017), ("b", 27017)]:
+            metrics.connection_checked_out(SimpleNamespace(address=address, duration=0.0))
+        stats = metrics.stats()
+        self.assertEqual(stats["checked_out"], 3)
+        self.assertEqual(stats["pools"]["a:27017"], {"checked_out": 2, "saturation": 1.0})
+        self.assertEqual(stats["saturation"], 1.0)
+
+    def test_client_is_created_by_connect_and_closed_on_shutdown(self):
+        self.addCleanup(setattr, db, "_client", db._client)
+        db._client = None
+        with mock.patch.object(db, "create_client") as create_client:
+            create_client.return_value.admin.command = mock.AsyncMock()
+            client = asyncio.run(db.connect())
+            self.assertIs(db.get_client(), client)
+            self.assertEqual(db.users_collection.name, "Users")
+            db.close()
+        create_client.assert_called_once()
+        client.close.assert_called_once()
+        self.assertIsNone(db._client)
+
+
+@unittest.skipUnless(os.getenv("MONGO_TEST_URI"), "explain() needs a real mongod; set MONGO_TEST_URI")
+class IndexCoverageTests(unittest.IsolatedAsyncioTestCase):
+    """Fails when a registered query pattern would be answered by a collection scan."""
+
+    async def asyncSetUp(self):
+        self.mongo = AsyncIOMotorClient(os.getenv("MONGO_TEST_URI"))
+        self.db = self.mongo[f"HypertrioIndexTest{int(time.time())}"]
+
+    async def asyncTearDown(self):
+        await self.mongo.drop_database(self.db.name)
+        self.mongo.close()
+
+    async def test_query_patterns_are_index_covered(self):
+        # Explaining against a missing collection plans EOF, so make sure each one exists
+        for collection_name in indexes.INDEXES:
+            await self.db[collection_name].insert_one({"seed": True})
+        await indexes.ensure_indexes(self.db)
+
+        self.assertEqual(await indexes.find_collection_scans(self.db), [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,60 @@
+"""
+Helpers shared by the benchmark scripts: pointing the app at a bench database,
+comparing a report against an earlier one, and writing the JSON report.
+"""
+import json
+import logging
+import os
+import sys
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app", "api")
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+def use_database(database):
+    """Point every collection handle the app imported at ``database``."""
+    for name, module in list(sys.modules.items()):
+        if not name.startswith(("services.", "routes.")):
+            continue
+        for attr, value in list(vars(module).items()):
+            if attr.endswith("_collection"):
+                setattr(module, attr, database[value.name])
+
+
+def add_changes(result: dict, previous: dict, keys: tuple) -> None:
+    """Record how each of ``keys`` moved against ``previous``, e.g. p95_ms as p95_change."""
+    for key in keys:
+        if previous.get(key):
+            result[key.removesuffix("_ms") + "_change"] = result[key] / previous[key] - 1
+
+
+def compare_sections(results: dict, baseline: dict, section: str, keys: tuple) -> None:
+    """add_changes for each named result against the same name under ``section`` in the baseline."""
+    for name, result in results.items():
+        previous = baseline.get(section, {}).get(name)
+        if previous:
+            add_changes(result, previous, keys)
+
+
+def add_report_arguments(parser) -> None:
+    parser.add_argument("--output", help="Write the report here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+
+
+def quiet_request_logs() -> None:
+    # One log line per request would dominate the run
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def write_report(args, report: dict, compare) -> None:
+    """Compare against --baseline when given, then write the report to --output or stdout."""
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
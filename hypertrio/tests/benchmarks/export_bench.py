@@ -0,0 +1,110 @@
+"""
+Benchmark: streaming export of a synthetic long-time user's history.
+
+Seeds one user with N completed sessions (plus one calorie day per session) and drains
+the NDJSON and CSV export streams, reporting throughput and the peak memory allocated
+while streaming. Peak memory should stay flat as --sessions grows.
+
+    python tests/benchmarks/export_bench.py [--sessions 10000,100000] [--mongo-uri mongodb://localhost:27017]
+
+Without --mongo-uri the in-memory Motor stand-in is used; it holds query results in
+memory itself, so use a real mongod to measure the API's own footprint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app", "api"))
+
+from routes import export
+
+USER_ID = "bench-user"
+SEED_BATCH_SIZE = 5000
+
+
+async def seed(database, sessions: int):
+    start = datetime(2000, 1, 1)
+    for offset in range(0, sessions, SEED_BATCH_SIZE):
+        count = min(SEED_BATCH_SIZE, sessions - offset)
+        await database["CompletedWorkouts"].insert_many([
+            {
+                "user_id": USER_ID,
+                "workout_name": "Full Body",
+                "completed_at": (start + timedelta(days=i)).isoformat(),
+                "exercises": {
+                    exercise: [{"kg": str(60 + i % 40), "reps": str(5 + s), "notes": ""} for s in range(3)]
+                    for exercise in ("Squat", "Bench Press", "Row")
+                },
+            }
+            for i in range(offset, offset + count)
+        ])
+        await database["Calories"].insert_many([
+            {
+                "user_id": USER_ID,
+                "date": start + timedelta(days=i),
+                "food": [{"name": "Meal", "calories": 700, "timestamp": start + timedelta(days=i, hours=h)} for h in (8, 13, 19)],
+                "total_calories": 2100,
+                "calorie_goal": 2000,
+            }
+            for i in range(offset, offset + count)
+        ])
+
+
+async def drain(stream) -> tuple:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    size = 0
+    async for chunk in stream:
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+async def run(sessions: int, mongo_uri: str | None) -> dict:
+    if mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(mongo_uri)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    database = client[f"HypertrioExportBench{sessions}"]
+    await database.drop_collection("CompletedWorkouts")
+    await database.drop_collection("Calories")
+    await seed(database, sessions)
+    export.completed_workouts_collection = database["CompletedWorkouts"]
+    export.calories_collection = database["Calories"]
+
+    result = {"sessions": sessions, "backend": "mongod" if mongo_uri else "mongomock"}
+    for name, stream in (("ndjson", export.stream_ndjson), ("csv", export.stream_csv)):
+        elapsed, size, peak = await drain(stream(USER_ID))
+        result[name] = {
+            "seconds": elapsed,
+            "documents_per_second": sessions * 2 / elapsed,
+            "megabytes": size / 1e6,
+            "peak_traced_megabytes": peak / 1e6,
+        }
+    if mongo_uri:
+        await client.drop_database(database.name)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", default="10000,100000", help="Comma-separated history lengths to benchmark")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_TEST_URI"))
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(int(sessions), args.mongo_uri)) for sessions in args.sessions.split(",")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
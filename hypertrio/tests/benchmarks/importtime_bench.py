@@ -0,0 +1,126 @@
+"""
+Startup profile: how long a fresh interpreter takes to import the API and the test suite.
+
+Each run starts a new ``python -X importtime`` process, so nothing is cached between
+runs. Reports, per target, the median wall time of the process and of the import
+itself, the modules spending the most import time themselves, and for the app how long
+each lazily loaded router takes to include on its first request.
+
+    python tests/benchmarks/importtime_bench.py [--runs 7] [--top 15] [--targets main,api_tests]
+        [--output report.json] [--baseline previous.json]
+
+With --baseline, each target also reports how its import time moved against that report.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from bench_common import add_report_arguments, compare_sections, write_report
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+API_DIR = os.path.normpath(os.path.join(ROOT, "app", "api"))
+TESTS_DIR = os.path.normpath(os.path.join(ROOT, "tests"))
+# Modules reported individually; everything else is grouped by top-level package
+FIRST_PARTY = {"main", "responses", "lazy_routes", "services", "routes", "api_tests"}
+
+# Written to stderr once the target is imported; later imports belong to the router loads
+MARKER = "-- imported --"
+
+PROBE = """
+import json, sys, time
+sys.path[:0] = {paths!r}
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter() - started
+print({marker!r}, file=sys.stderr, flush=True)
+routers = {{}}
+if {load_routers}:
+    import main
+    for prefix in main.ROUTERS:
+        started = time.perf_counter()
+        main.routers.load(prefix)
+        routers[prefix] = time.perf_counter() - started
+print(json.dumps({{"import_seconds": imported, "router_seconds": routers}}))
+"""
+
+TARGETS = {
+    "main": {"paths": [API_DIR], "load_routers": True},
+    "api_tests": {"paths": [TESTS_DIR, API_DIR], "load_routers": False},
+}
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Self time in microseconds per module group from ``-X importtime`` output, up to the marker."""
+    self_us = {}
+    for line in stderr.splitlines():
+        if line == MARKER:
+            break
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        root = name.split(".")[0]
+        group = name if root in FIRST_PARTY else root
+        self_us[group] = self_us.get(group, 0) + int(own)
+    return self_us
+
+
+def run_once(target: str) -> dict:
+    config = TARGETS[target]
+    code = PROBE.format(paths=config["paths"], module=target, load_routers=config["load_routers"], marker=MARKER)
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=config["paths"][0], capture_output=True, text=True, check=True
+    )
+    process_seconds = time.perf_counter() - started
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return {"process_seconds": process_seconds, **probe, "self_us": parse_importtime(result.stderr)}
+
+
+def summarize(runs: list, top: int) -> dict:
+    groups = {group for run in runs for group in run["self_us"]}
+    self_ms = {group: statistics.median(run["self_us"].get(group, 0) for run in runs) / 1000 for group in groups}
+    summary = {
+        "process_ms": statistics.median(run["process_seconds"] for run in runs) * 1000,
+        "import_ms": statistics.median(run["import_seconds"] for run in runs) * 1000,
+        "import_ms_min": min(run["import_seconds"] for run in runs) * 1000,
+        "top_self_ms": dict(sorted(self_ms.items(), key=lambda item: -item[1])[:top]),
+    }
+    if runs[0]["router_seconds"]:
+        summary["router_load_ms"] = {
+            prefix: statistics.median(run["router_seconds"][prefix] for run in runs) * 1000
+            for prefix in runs[0]["router_seconds"]
+        }
+    return summary
+
+
+def compare(report: dict, baseline: dict) -> None:
+    compare_sections(report["targets"], baseline, "targets", ("import_ms", "process_ms"))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7, help="Fresh interpreters per target")
+    parser.add_argument("--top", type=int, default=15, help="Modules listed by self time")
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    unknown = set(args.targets.split(",")) - set(TARGETS)
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for target in args.targets.split(","):
+        results[target] = summarize([run_once(target) for _ in range(args.runs)], args.top)
+    write_report(args, {"python": platform.python_version(), "runs": args.runs, "targets": results}, compare)
+
+
+if __name__ == "__main__":
+    main_cli()
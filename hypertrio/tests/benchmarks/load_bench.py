@@ -0,0 +1,182 @@
+"""
+Load test: throughput and latency percentiles of the main API flows.
+
+Runs the FastAPI app in-process against an in-memory Motor stand-in (or a real
+mongod with --mongo-uri), seeds synthetic users with workout and calorie histories,
+then drives each scenario at the given concurrency and prints one JSON report.
+
+    python tests/benchmarks/load_bench.py [--users 20] [--sessions 200] [--days 120]
+        [--concurrency 16] [--requests 2000] [--scenarios login,session,dashboard,log_calories,exercises]
+        [--mongo-uri mongodb://localhost:27017] [--output report.json] [--baseline previous.json]
+
+With --baseline, each scenario also reports how its RPS and p95 moved against that report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench_common import add_report_arguments, compare_sections, quiet_request_logs, use_database, write_report
+from httpx import AsyncClient, ASGITransport
+
+import main
+from services import db
+from services.derived_updates import derived_queue
+from services.indexes import ensure_indexes
+
+PASSWORD = "benchmark-password"
+EXERCISES = ["Bench Press", "Squat", "Deadlift", "Overhead Press", "Row", "Pull Up"]
+FOODS = [("Oats", 350), ("Chicken and rice", 650), ("Protein shake", 200), ("Pasta", 700), ("Apple", 90)]
+
+
+def workout_history(sessions: int, rng: random.Random) -> str:
+    """NDJSON completed workouts, one per day, for the import endpoint."""
+    start = datetime(2024, 1, 1, 7, tzinfo=timezone.utc)
+    lines = []
+    for i in range(sessions):
+        exercises = {
+            name: [{"kg": str(40 + i // 4 + rng.randint(0, 10)), "reps": str(rng.randint(3, 12)), "notes": ""}
+                   for _ in range(3)]
+            for name in rng.sample(EXERCISES, 3)
+        }
+        completed_at = (start + timedelta(days=i)).isoformat().replace("+00:00", "Z")
+        lines.append(json.dumps({"workout_name": "Session", "completed_at": completed_at, "exercises": exercises}))
+    return "\n".join(lines) + "\n"
+
+
+def calorie_history(days: int, rng: random.Random) -> list:
+    today = datetime.now(timezone.utc).replace(hour=8, minute=0, second=0, microsecond=0)
+    return [
+        {"name": name, "calories": calories, "timestamp": (today - timedelta(days=day, hours=-meal * 4)).isoformat()}
+        for day in range(days)
+        for meal, (name, calories) in enumerate(rng.sample(FOODS, 3))
+    ]
+
+
+async def seed(client: AsyncClient, users: int, sessions: int, days: int) -> list:
+    rng = random.Random(42)
+    seeded = []
+    for i in range(users):
+        email = f"bench{i}@example.com"
+        await client.post("/auth/register", json={"name": f"Bench {i}", "email": email, "password": PASSWORD})
+        login = (await client.post("/auth/login", json={"email": email, "password": PASSWORD})).json()
+        user_id = login["_id"]
+        response = await client.post(f"/import/{user_id}", content=workout_history(sessions, rng))
+        response.raise_for_status()
+        response = await client.post(f"/calories/log/{user_id}/batch", json={"entries": calorie_history(days, rng)})
+        response.raise_for_status()
+        seeded.append({"email": email, "user_id": user_id, "session_id": login["sessionId"]})
+    return seeded
+
+
+SCENARIOS = {
+    "login": lambda client, user: client.post("/auth/login", json={"email": user["email"], "password": PASSWORD}),
+    "session": lambda client, user: client.get(f"/auth/session/{user['session_id']}"),
+    "dashboard": lambda client, user: client.get(f"/dashboard/{user['user_id']}"),
+    "log_calories": lambda client, user: client.post(f"/calories/log/{user['user_id']}", json={"food": "Banana", "calories": 105}),
+    "exercises": lambda client, user: client.get(f"/workouts/exercises/{user['user_id']}"),
+}
+
+
+async def run_scenario(client: AsyncClient, users: list, scenario, concurrency: int, requests: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker(offset: int):
+        nonlocal remaining, errors
+        i = offset
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await scenario(client, users[i % len(users)])
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def compare(report: dict, baseline: dict) -> None:
+    compare_sections(report["scenarios"], baseline, "scenarios", ("rps", "p95_ms"))
+
+
+async def run(args) -> dict:
+    if args.mongo_uri:
+        database = db.create_client(args.mongo_uri)["HypertrioLoadBench"]
+        for name in await database.list_collection_names():
+            await database.drop_collection(name)
+        await ensure_indexes(database)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        database = AsyncMongoMockClient()["HypertrioLoadBench"]
+    use_database(database)
+    derived_queue.start()
+
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://bench", timeout=60) as client:
+        seed_started = time.perf_counter()
+        users = await seed(client, args.users, args.sessions, args.days)
+        seed_seconds = time.perf_counter() - seed_started
+        await derived_queue.drain()
+        derived_queue.start()
+
+        results = {}
+        for name in args.scenarios.split(","):
+            results[name] = await run_scenario(client, users, SCENARIOS[name], args.concurrency, args.requests)
+
+    await derived_queue.drain()
+    if args.mongo_uri:
+        await database.client.drop_database(database.name)
+    return {
+        "backend": "mongod" if args.mongo_uri else "mongomock",
+        "users": args.users,
+        "sessions_per_user": args.sessions,
+        "calorie_days_per_user": args.days,
+        "concurrency": args.concurrency,
+        "python": platform.python_version(),
+        "seed_seconds": seed_seconds,
+        "scenarios": results,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=200, help="Completed workouts per user")
+    parser.add_argument("--days", type=int, default=120, help="Days of calorie logs per user")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_TEST_URI"))
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    quiet_request_logs()
+    write_report(args, asyncio.run(run(args)), compare)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,100 @@
+"""
+Benchmark: latency of an unrelated route while a storm of logins is hashing passwords.
+
+Runs the FastAPI app in-process against an in-memory Motor stand-in, samples the
+latency of one cheap route on its own and again while --logins concurrent logins
+are in flight, and prints one JSON report. The storm p99 should stay near the
+baseline and well below the time of a single argon2 hash.
+
+    python tests/benchmarks/login_storm_bench.py [--logins 8] [--samples 200]
+        [--output report.json] [--baseline previous.json]
+
+With --baseline, the report also shows how both p99s moved against that report.
+"""
+import argparse
+import asyncio
+import gc
+import platform
+import statistics
+import time
+
+from bench_common import add_changes, add_report_arguments, quiet_request_logs, use_database, write_report
+from httpx import AsyncClient, ASGITransport
+from mongomock_motor import AsyncMongoMockClient
+
+import main
+from services.hashing import password_hasher
+
+EMAIL = "storm@example.com"
+PASSWORD = "benchmark-password"
+PROBE_PATH = "/workouts/workouts/storm-user"
+
+
+async def sample_latencies(client: AsyncClient, samples: int) -> list:
+    # Keep garbage collection pauses out of the measurement, as timeit does
+    gc.collect()
+    gc.disable()
+    try:
+        latencies = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            response = await client.get(PROBE_PATH)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+            # The in-memory database never suspends; yield so the storm's logins make progress
+            await asyncio.sleep(0)
+        return latencies
+    finally:
+        gc.enable()
+
+
+def p99_ms(latencies: list) -> float:
+    return statistics.quantiles(latencies, n=100, method="inclusive")[98] * 1000
+
+
+async def run(args) -> dict:
+    use_database(AsyncMongoMockClient()["HypertrioLoginStormBench"])
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://bench", timeout=60) as client:
+        await client.post("/auth/register", json={"name": "Storm", "email": EMAIL, "password": PASSWORD})
+        started = time.perf_counter()
+        await password_hasher.verify(PASSWORD, await password_hasher.hash(PASSWORD))
+        hash_seconds = (time.perf_counter() - started) / 2
+        baseline = await sample_latencies(client, args.samples)
+
+        storm = asyncio.gather(*[
+            client.post("/auth/login", json={"email": EMAIL, "password": PASSWORD}) for _ in range(args.logins)
+        ])
+        await asyncio.sleep(0)
+        during_storm = await sample_latencies(client, args.samples)
+        responses = await storm
+
+    password_hasher.shutdown()
+    return {
+        "python": platform.python_version(),
+        "logins": args.logins,
+        "samples": args.samples,
+        "login_errors": sum(response.status_code != 200 for response in responses),
+        "argon2_ms": hash_seconds * 1000,
+        "baseline_p99_ms": p99_ms(baseline),
+        "storm_p99_ms": p99_ms(during_storm),
+        "hasher": password_hasher.stats(),
+    }
+
+
+def compare(report: dict, baseline: dict) -> None:
+    add_changes(report, baseline, ("baseline_p99_ms", "storm_p99_ms"))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=8, help="Concurrent logins in the storm")
+    parser.add_argument("--samples", type=int, default=200, help="Requests timed on the probe route per phase")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    quiet_request_logs()
+    write_report(args, asyncio.run(run(args)), compare)
+
+
+if __name__ == "__main__":
+    main_cli()
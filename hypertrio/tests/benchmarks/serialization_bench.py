@@ -0,0 +1,77 @@
+"""
+Microbenchmark: cost per document of rendering large exercise-history responses.
+
+Compares FastAPI's default path (stringify ObjectIds, jsonable_encoder, JSONResponse)
+with the orjson-based BSONResponse the API now uses.
+
+    python tests/benchmarks/serialization_bench.py [--documents 20000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app", "api"))
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from responses import BSONResponse
+
+
+def completed_workouts(count: int) -> list:
+    """Synthetic CompletedWorkouts documents as Motor returns them."""
+    start = datetime(2023, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": "user1",
+            "workout_name": "Push",
+            "completed_at": start + timedelta(days=i),
+            "exercises": {
+                exercise: [{"kg": str(40 + i % 50), "reps": str(6 + s), "notes": ""} for s in range(3)]
+                for exercise in ("Bench Press", "Overhead Press", "Dips")
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def default_render(documents: list) -> bytes:
+    for document in documents:
+        document["_id"] = str(document["_id"])
+    return JSONResponse(jsonable_encoder(documents)).body
+
+
+def bson_render(documents: list) -> bytes:
+    return BSONResponse(documents).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for name, render in (("jsonable_encoder", default_render), ("bson_orjson", bson_render)):
+        timings = []
+        for _ in range(args.repeat):
+            # Fresh documents each run, since the default path stringifies _id in place
+            batch = completed_workouts(args.documents)
+            timings.append(timeit.timeit(lambda: render(batch), number=1))
+        best = min(timings)
+        results[name] = {
+            "documents": args.documents,
+            "best_seconds": best,
+            "us_per_document": best / args.documents * 1e6,
+        }
+
+    results["speedup"] = results["jsonable_encoder"]["best_seconds"] / results["bson_orjson"]["best_seconds"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()